@@ -0,0 +1,797 @@
+#!/usr/bin/env python3
+"""
+Benchmark for mongo-to-mysql-import.py
+Generates synthetic BSON dumps and times every migration against an
+in-process SQLite stand-in or a real MySQL server
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from bson import encode, ObjectId, Int64, Decimal128
+
+IMPORTER_PATH = Path(__file__).resolve().parent / 'mongo-to-mysql-import.py'
+
+# Generated dumps are cached per scale and seed; results are kept so runs of
+# different versions can be compared with --compare
+BENCHMARK_PATH = Path(__file__).resolve().parent / 'benchmark'
+DUMPS_PATH = BENCHMARK_PATH / 'dumps'
+RESULTS_PATH = BENCHMARK_PATH / 'results'
+
+# Documents per collection at --scale 1
+COLLECTION_SIZES = {
+    'User': 2000,
+    'Category': 100,
+    'Brand': 300,
+    'LeadForm': 20,
+    'Campaign': 3000,
+    'Post': 300,
+    'Page': 30,
+    'Bank': 30,
+    'Slider': 20,
+    'Ads': 50,
+    'Attribute': 100,
+    'Product': 10000,
+    'ProductPriceHistory': 100000,
+    'Car': 500,
+    'RealEstate': 300,
+    'Lead': 10000,
+}
+
+# BSON file read by each migration
+MIGRATION_FILES = {
+    'settings': 'Setting', 'users': 'User', 'categories': 'Category',
+    'brands': 'Brand', 'attributes': 'Attribute', 'lead_forms': 'LeadForm',
+    'banks': 'Bank', 'campaigns': 'Campaign', 'posts': 'Post', 'pages': 'Page',
+    'sliders': 'Slider', 'ads': 'Ads', 'products': 'Product',
+    'product_price_histories': 'ProductPriceHistory', 'cars': 'Car',
+    'real_estates': 'RealEstate', 'leads': 'Lead',
+}
+
+def load_importer():
+    """Import the migration script, whose file name isn't a module name
+
+    It is registered in sys.modules so that worker processes, which
+    re-import this file, can unpickle the functions it sends them.
+    """
+    spec = importlib.util.spec_from_file_location('mongo_to_mysql_import', IMPORTER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+importer = load_importer()
+
+# Synthetic data
+
+WORDS = [
+    'kampanya', 'indirim', 'fırsat', 'kredi', 'kart', 'taksit', 'hediye', 'puan',
+    'çekiliş', 'öğrenci', 'şubat', 'güz', 'yaz', 'kış', 'ücretsiz', 'kargo',
+    'elektronik', 'telefon', 'televizyon', 'beyaz', 'eşya', 'market', 'giyim', 'ayakkabı',
+]
+CITIES = ['İstanbul', 'Ankara', 'İzmir', 'Bursa', 'Antalya', 'Kocaeli']
+
+def write_collection(path, documents):
+    """Write documents to a .bson file the way mongodump does"""
+    count = 0
+    with open(path, 'wb') as f:
+        for doc in documents:
+            f.write(encode(doc))
+            count += 1
+    return count
+
+class DumpGenerator:
+    """Build related synthetic documents for every collection the importer reads
+
+    Ids created for one collection are kept so later collections reference
+    them the way the production data does: campaigns point at brands,
+    categories and lead forms, leads at campaigns and users, price
+    histories at product GTINs (plus a few unknown ones). A `dirty` share
+    of campaigns and products get a title too long for its column.
+    """
+
+    def __init__(self, scale=1.0, seed=42, dirty=0.0):
+        self.scale = scale
+        self.dirty = dirty
+        self.random = random.Random(seed)
+        self.ids = {}
+        self.gtins = []
+        self.base_time = datetime(2023, 1, 1)
+
+    def size(self, collection):
+        return max(1, int(COLLECTION_SIZES[collection] * self.scale))
+
+    def words(self, count):
+        return ' '.join(self.random.choice(WORDS) for _ in range(count))
+
+    def slug(self, count=3):
+        return '-'.join(self.random.choice(WORDS) for _ in range(count))
+
+    def title(self, title):
+        if self.dirty and self.random.random() < self.dirty:
+            return (title + ' ') * 50
+        return title
+
+    def timestamps(self):
+        created = self.base_time + timedelta(minutes=self.random.randrange(1_000_000))
+        return created, created + timedelta(minutes=self.random.randrange(100_000))
+
+    def meta(self):
+        return {
+            'title': self.words(5),
+            'description': self.words(20),
+            'keywords': [self.random.choice(WORDS) for _ in range(5)],
+            'editedBy': ObjectId(),
+            'editedAt': self.timestamps()[1],
+        }
+
+    def pick(self, collection, count=1):
+        ids = self.ids.get(collection, [])
+        return self.random.sample(ids, min(count, len(ids)))
+
+    def generate(self, path):
+        """Write every collection into `path` and return the document counts"""
+        path.mkdir(parents=True, exist_ok=True)
+        counts = {}
+        for collection in ['Setting'] + list(COLLECTION_SIZES):
+            make = getattr(self, 'make_' + re.sub(r'(?<!^)([A-Z])', r'_\1', collection).lower())
+            counts[collection] = write_collection(path / f"{collection}.bson", make())
+        return counts
+
+    def keep(self, collection, doc):
+        self.ids.setdefault(collection, []).append(doc['_id'])
+        return doc
+
+    def make_setting(self):
+        yield {
+            '_id': ObjectId(), 'logo': '/logo.png', 'metaTitle': 'KampanyaRadar',
+            'metaDescription': self.words(12), 'metaKeywords': ', '.join(WORDS[:6]),
+            'metaSeperate': '|', 'headAfterCode': '<script></script>', 'bodyAfterCode': '',
+        }
+
+    def make_user(self):
+        for i in range(self.size('User')):
+            created, updated = self.timestamps()
+            yield self.keep('User', {
+                '_id': ObjectId(), 'firstName': 'Ayşe', 'lastName': 'Yılmaz',
+                'email': f"user{i}@example.com", 'phone': f"+90555{i:07d}",
+                'password': '$2b$10$' + 'x' * 53, 'role': self.random.choice(['user', 'admin']),
+                'isBanned': False, 'isActive': True, 'lastLogin': updated,
+                'birthDate': datetime(1970 + self.random.randrange(40), 1, 1),
+                'gender': self.random.choice(['male', 'female', None]),
+                'createdAt': created, 'updatedAt': updated,
+            })
+
+    def make_category(self):
+        for i in range(self.size('Category')):
+            created, updated = self.timestamps()
+            parents = self.ids.get('Category', [])
+            yield self.keep('Category', {
+                '_id': ObjectId(), 'name': f"{self.words(2).title()} {i}", 'slug': f"{self.slug(2)}-{i}",
+                'parentId': self.random.choice(parents) if parents and self.random.random() < 0.7 else None,
+                'isActive': True, 'content': self.words(40), 'description': self.words(15),
+                'meta': self.meta(), 'created_at': created, 'updated_at': updated,
+            })
+
+    def make_brand(self):
+        count = self.size('Brand')
+        for i in range(count):
+            created, updated = self.timestamps()
+            # About 5% of the brands repeat an earlier name or slug
+            number = self.random.randrange(i) if i and self.random.random() < 0.05 else i
+            yield self.keep('Brand', {
+                '_id': ObjectId(), 'name': f"Marka {number}", 'slug': f"marka-{number % (count // 2 + 1)}",
+                'logo': f"/brands/{i}.png", 'isActive': True, 'content': self.words(30),
+                'created_at': created, 'updated_at': updated,
+            })
+
+    def make_lead_form(self):
+        for i in range(self.size('LeadForm')):
+            created, updated = self.timestamps()
+            yield self.keep('LeadForm', {
+                '_id': ObjectId(), 'name': f"Form {i}", 'description': self.words(10),
+                'buttonText': 'Başvur', 'isCategoryShow': self.random.random() < 0.5,
+                'fields': [
+                    {'_id': ObjectId(), 'name': name, 'type': 'text', 'required': True}
+                    for name in ('ad', 'soyad', 'telefon', 'e-posta')
+                ],
+                'created_at': created, 'updated_at': updated,
+            })
+
+    def make_campaign(self):
+        # Campaign slugs repeat a lot in production, which is what the slug
+        # allocator has to cope with
+        base_slugs = [self.slug() for _ in range(max(1, self.size('Campaign') // 20))]
+        for i in range(self.size('Campaign')):
+            created, updated = self.timestamps()
+            yield self.keep('Campaign', {
+                '_id': ObjectId(), 'slug': self.random.choice(base_slugs), 'title': self.title(self.words(6).capitalize()),
+                'isActive': True, 'isActiveButton': True, 'image': f"/campaigns/{i}.jpg",
+                'content': self.words(200), 'link': f"https://example.com/kampanya/{i}",
+                'startDate': created, 'endDate': created + timedelta(days=30),
+                'itemType': 'general', 'itemId': None,
+                'actuals': [{'title': self.words(3), 'value': self.random.randrange(100)} for _ in range(3)],
+                'couponCode': None, 'meta': self.meta(), 'isActiveAds': True,
+                'leadFormId': self.pick('LeadForm')[0] if self.random.random() < 0.3 else None,
+                'brandIds': self.pick('Brand', self.random.randrange(1, 4)),
+                'categoryIds': self.pick('Category', self.random.randrange(1, 4)),
+                'created_at': created, 'updated_at': updated,
+            })
+
+    def make_post(self):
+        for i in range(self.size('Post')):
+            created, updated = self.timestamps()
+            yield self.keep('Post', {
+                '_id': ObjectId(), 'slug': self.slug(), 'title': self.words(6),
+                'content': self.words(400), 'image': f"/posts/{i}.jpg", 'meta': self.meta(),
+                'categoryIds': self.pick('Category', self.random.randrange(1, 3)),
+                'created_at': created, 'updated_at': updated,
+            })
+
+    def make_page(self):
+        for i in range(self.size('Page')):
+            created, updated = self.timestamps()
+            yield self.keep('Page', {
+                '_id': ObjectId(), 'slug': self.slug(2), 'title': self.words(3),
+                'content': self.words(300), 'meta': self.meta(),
+                'createdAt': created, 'updatedAt': updated,
+            })
+
+    def make_bank(self):
+        for i in range(self.size('Bank')):
+            offer = {'rate': Decimal128(f"{self.random.uniform(1, 5):.2f}"), 'maxTerm': 36, 'updatedAt': self.timestamps()[1]}
+            yield self.keep('Bank', {
+                '_id': ObjectId(), 'brandId': self.pick('Brand')[0], 'content': self.words(100),
+                'faqs': [{'question': self.words(8) + '?', 'answer': self.words(30)} for _ in range(5)],
+                'personal': dict(offer), 'mortgage': dict(offer), 'newCar': dict(offer), 'usedCar': dict(offer),
+                'isActive': True, 'sponsoredStatus': self.random.random() < 0.2,
+            })
+
+    def make_slider(self):
+        for i in range(self.size('Slider')):
+            created, updated = self.timestamps()
+            yield {
+                '_id': ObjectId(), 'name': self.words(3), 'image': f"/sliders/{i}.jpg",
+                'link': f"https://example.com/{i}", 'isActive': True,
+                'createdAt': created, 'updatedAt': updated,
+            }
+
+    def make_ads(self):
+        for i in range(self.size('Ads')):
+            created, updated = self.timestamps()
+            yield {
+                '_id': ObjectId(), 'name': self.words(2), 'type': 'image', 'itemType': 'campaign',
+                'device': self.random.choice(['desktop', 'mobile']), 'item': str(ObjectId()),
+                'image': f"/ads/{i}.jpg", 'link': f"https://example.com/ads/{i}", 'code': '',
+                'isActive': True, 'position': self.random.randrange(10),
+                'createdAt': created, 'updatedAt': updated,
+            }
+
+    def make_attribute(self):
+        for i in range(self.size('Attribute')):
+            yield {'_id': ObjectId(), 'name': f"{self.words(2)} {i}", 'type': self.random.choice(['text', 'number'])}
+
+    def make_product(self):
+        brand_names = [f"Marka {i}" for i in range(self.size('Brand'))]
+        for i in range(self.size('Product')):
+            created, updated = self.timestamps()
+            gtin = f"{8690000000000 + i}"
+            self.gtins.append(gtin)
+            yield {
+                '_id': ObjectId(), 'title': self.title(self.words(5).title()), 'gtin': gtin,
+                'description': self.words(60), 'brand': self.random.choice(brand_names),
+                'attributes': [
+                    {'_id': ObjectId(), 'name': self.random.choice(WORDS), 'value': self.words(2)}
+                    for _ in range(self.random.randrange(5, 25))
+                ],
+                'stores': [
+                    {
+                        'name': f"Mağaza {store}", 'price': f"{self.random.uniform(10, 50000):.2f}",
+                        'image_link': f"https://cdn.example.com/{gtin}/{store}.jpg",
+                        'link': f"https://store{store}.example.com/{gtin}", 'updatedAt': updated,
+                    }
+                    for store in range(self.random.randrange(1, 8))
+                ],
+                # Some dumps store timestamps as epoch milliseconds
+                'createdAt': created if i % 10 else int(created.timestamp() * 1000),
+                'updatedAt': updated,
+            }
+
+    def make_product_price_history(self):
+        for i in range(self.size('ProductPriceHistory')):
+            # One history in fifty points at a product that doesn't exist
+            gtin = self.random.choice(self.gtins) if self.random.random() < 0.98 else f"999{i:010d}"
+            yield {
+                '_id': ObjectId(), 'gtin': gtin, 'date': self.timestamps()[0],
+                'storePrice': round(self.random.uniform(10, 50000), 2),
+                'storeBrand': f"Mağaza {self.random.randrange(8)}",
+            }
+
+    def make_car(self):
+        for i in range(self.size('Car')):
+            created, updated = self.timestamps()
+            yield {
+                '_id': ObjectId(), 'model': f"Model {i}", 'brand': f"Marka {self.random.randrange(30)}",
+                'historyPrices': [
+                    {'date': created + timedelta(days=day), 'price': Int64(self.random.randrange(500_000, 5_000_000))}
+                    for day in range(0, 365 * 2, 7)
+                ],
+                'attributes': [{'name': self.random.choice(WORDS), 'value': self.words(2)} for _ in range(40)],
+                'images': [f"https://cdn.example.com/cars/{i}/{n}.jpg" for n in range(12)],
+                'euroncap': {'stars': self.random.randrange(1, 6), 'adult': self.random.randrange(100), 'child': self.random.randrange(100)},
+                'colors': [{'name': self.random.choice(WORDS), 'hex': f"#{self.random.randrange(1 << 24):06x}"} for _ in range(6)],
+                'createdAt': created, 'updatedAt': updated,
+            }
+
+    def make_real_estate(self):
+        for i in range(self.size('RealEstate')):
+            created, updated = self.timestamps()
+            yield {
+                '_id': ObjectId(), 'name': f"{self.words(2).title()} Konutları {i}",
+                'deliveryDate': created + timedelta(days=700), 'unitDelivery': 'Anahtar teslim',
+                'propertyType': self.random.choice(['daire', 'villa', 'rezidans']),
+                'numberOfUnits': self.random.randrange(20, 2000), 'floorCount': self.random.randrange(2, 40),
+                'elevator': 'Var', 'parking': 'Kapalı otopark', 'heating': 'Yerden ısıtma',
+                'mapsUrl': f"https://maps.example.com/?q={i}",
+                'images': [f"https://cdn.example.com/estates/{i}/{n}.jpg" for n in range(15)],
+                'pricePlans': [
+                    {'type': f"{rooms}+1", 'size': rooms * 45, 'price': Int64(rooms * 1_500_000)}
+                    for rooms in range(1, 5)
+                ],
+                'owners': [{'_id': ObjectId(), 'name': self.words(2).title()}],
+                'country': 'Turkiye', 'city': self.random.choice(CITIES), 'district': self.words(1).title(),
+                'createdAt': created, 'updatedAt': updated,
+            }
+
+    def make_lead(self):
+        for i in range(self.size('Lead')):
+            created, updated = self.timestamps()
+            yield {
+                '_id': ObjectId(), 'campaignId': self.pick('Campaign')[0],
+                'userId': self.pick('User')[0] if self.random.random() < 0.5 else None,
+                'formId': self.pick('LeadForm')[0],
+                'formValues': [
+                    {'name': 'ad', 'value': 'Mehmet'}, {'name': 'telefon', 'value': f"+90532{i:07d}"},
+                    {'name': 'e-posta', 'value': f"lead{i}@example.com"},
+                ],
+                'interestCategories': self.pick('Category', 2),
+                'createdAt': created, 'updatedAt': updated,
+            }
+
+def get_dump(scale, seed, dirty=0.0):
+    """Return the directory holding the dump for a scale, seed and dirty share, generating it once"""
+    path = DUMPS_PATH / f"scale-{scale:g}-seed-{seed}"
+    if dirty:
+        path = path.with_name(f"{path.name}-dirty-{dirty:g}")
+    manifest = path / 'manifest.json'
+    if not manifest.exists():
+        print(f"Generating synthetic dump in {path}...")
+        started = time.perf_counter()
+        counts = DumpGenerator(scale, seed, dirty).generate(path)
+        manifest.write_text(json.dumps(counts, indent=2))
+        print(f"Generated {sum(counts.values())} documents in {time.perf_counter() - started:.1f}s")
+    return path
+
+# Database targets
+
+class Statistics:
+    """Round trips and rows written, as seen through the counting wrappers"""
+
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+        self.rows = Counter()
+
+WRITE_TARGET = re.compile(r"\s*(?:INSERT INTO|LOAD DATA LOCAL INFILE %s INTO TABLE)\s+(\w+)", re.IGNORECASE)
+
+class CountingCursor:
+    """Cursor wrapper that counts statements and the rows they insert"""
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def execute(self, sql, params=None):
+        self._stats.statements += 1
+        result = self._cursor.execute(sql, params) if params is not None else self._cursor.execute(sql)
+        target = WRITE_TARGET.match(sql)
+        # The importer rolls back a load that raised warnings
+        if target and self._cursor.rowcount > 0 and not self._cursor.warning_count:
+            self._stats.rows[target.group(1)] += self._cursor.rowcount
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class CountingConnection:
+    """Connection wrapper whose cursors and commits are counted"""
+
+    def __init__(self, conn, stats):
+        self._conn = conn
+        self._stats = stats
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self._stats)
+
+    def commit(self):
+        self._stats.commits += 1
+        self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+class CountingPool:
+    """Stands in for the importer's connection pool"""
+
+    def __init__(self, connect, stats):
+        self.connect = connect
+        self.stats = stats
+
+    def get_connection(self):
+        return CountingConnection(self.connect(), self.stats)
+
+# Tables the stand-in creates, with the unique keys of the Laravel schema; the
+# VARCHAR(255) titles are checked like MySQL's strict mode does, so the
+# overlong titles of a --dirty dump are rejected
+STAND_IN_SCHEMA = {
+    'users': 'first_name, last_name, email UNIQUE, phone, password, role, is_banned, is_active, last_login, birth_date, gender, created_at, updated_at',
+    'categories': 'name, slug UNIQUE, parent_id, is_active, content, description, meta, created_at, updated_at',
+    'brands': 'name, slug UNIQUE, logo, is_active, content, created_at, updated_at',
+    'campaigns': 'slug UNIQUE, title CHECK (length(title) <= 255), is_active, is_active_button, image, content, link, start_date, end_date, item_type, item_id, actuals, coupon_code, meta, is_active_ads, form_id, created_at, updated_at',
+    'posts': 'slug UNIQUE, title, content, image, meta, created_at, updated_at',
+    'lead_forms': 'name, description, button_text, is_category_show, fields, created_at, updated_at',
+    'pages': 'slug UNIQUE, title, content, meta, created_at, updated_at',
+    'banks': 'brand_id, content, faqs, personal, mortgage, new_car, used_car, is_active, sponsored_status, created_at, updated_at',
+    'sliders': 'name, image, link, is_active, created_at, updated_at',
+    'ads': 'name, type, item_type, device, item, image, link, code, is_active, position, created_at, updated_at',
+    'leads': 'campaign_id, form_values, interest_categories, created_at, updated_at',
+    'products': 'title CHECK (length(title) <= 255), gtin, description, brand_id, attributes, stores, images, image, price, created_at, updated_at',
+    'product_price_histories': 'gtin, date, store_price, store_brand, created_at, updated_at',
+    'cars': 'model, brand, history_prices, attributes, images, euroncap, colors, created_at, updated_at',
+    'real_estates': 'name, delivery_date, unit_delivery, property_type, number_of_units, floor_count, elevator, parking, heating, maps_url, images, price_plans, owners, country, city, district, created_at, updated_at',
+    'attributes': 'name, type, created_at, updated_at',
+    'settings': '`key` UNIQUE, value, updated_at',
+}
+STAND_IN_PIVOTS = {
+    'campaign_brand': ('campaign_id', 'brand_id'),
+    'campaign_category': ('campaign_id', 'category_id'),
+    'category_post': ('category_id', 'post_id'),
+}
+STAND_IN_SETTINGS = ['site_logo', 'meta_title', 'meta_description', 'meta_keywords', 'meta_separator', 'head_after_code', 'body_after_code']
+
+LOAD_DATA = re.compile(r"\s*LOAD DATA LOCAL INFILE %s INTO TABLE (\w+).*\((.*?)\)\s*$", re.DOTALL)
+TSV_UNESCAPES = {'\\\\': '\\', '\\t': '\t', '\\n': '\n', '\\r': '\r', '\\0': '\0'}
+
+def constraint_error(error):
+    """Return the error MySQL raises where SQLite reports a failed constraint"""
+    duplicate = 'UNIQUE' in str(error)
+    return importer.mysql.connector.errors.get_mysql_exception(
+        1062 if duplicate else 3819, str(error), '23000' if duplicate else 'HY000'
+    )
+
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(value.decode()))
+
+class StandInDatabase:
+    """In-memory SQLite database that accepts the importer's MySQL statements
+
+    MySQL-only statements (session variables, AUTO_INCREMENT, savepoints
+    outside a transaction) are translated or answered directly, so the
+    importer's own code runs unchanged. It measures the client side of a
+    migration; server-side costs like index maintenance differ from MySQL.
+    """
+
+    def __init__(self):
+        self.sqlite = sqlite3.connect(':memory:', check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        for table, columns in STAND_IN_SCHEMA.items():
+            self.sqlite.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, {columns})")
+        for table, columns in STAND_IN_PIVOTS.items():
+            self.sqlite.execute(f"CREATE TABLE {table} ({', '.join(columns)}, PRIMARY KEY ({', '.join(columns)}))")
+        self.sqlite.executemany("INSERT INTO settings (`key`, value) VALUES (?, '')", [(key,) for key in STAND_IN_SETTINGS])
+        self.sqlite.commit()
+
+    def connect(self):
+        return StandInConnection(self)
+
+class StandInConnection:
+    def __init__(self, database):
+        self.database = database
+        self.questions = 0
+
+    @property
+    def in_transaction(self):
+        return self.database.sqlite.in_transaction
+
+    def cursor(self, *args, **kwargs):
+        return StandInCursor(self)
+
+    def commit(self):
+        self.database.sqlite.commit()
+
+    def rollback(self):
+        self.database.sqlite.rollback()
+
+    def close(self):
+        pass
+
+class StandInCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.sqlite = connection.database.sqlite
+        self.rowcount = -1
+        self.results = []
+        self.warnings = []
+
+    @property
+    def warning_count(self):
+        return len(self.warnings)
+
+    def execute(self, sql, params=()):
+        statement = sql.strip()
+        self.results = []
+        self.rowcount = -1
+        self.connection.questions += 1
+        if statement.startswith('SHOW WARNINGS'):
+            self.results = self.warnings[:1] if 'LIMIT 1' in statement else self.warnings
+            return
+        self.warnings = []
+        if statement.startswith('SHOW SESSION STATUS'):
+            self.results = [('Questions', self.connection.questions)]
+        elif statement.startswith('SELECT @@max_allowed_packet'):
+            self.results = [(64 * 1024 * 1024,)]
+        elif statement.startswith('SELECT @@'):
+            self.results = [(0,)]
+        elif 'information_schema' in statement:
+            self.results = [(None,)]
+        elif statement.startswith(('SET ', 'ALTER TABLE')):
+            pass
+        elif statement.startswith('TRUNCATE TABLE'):
+            self.sqlite.execute(f"DELETE FROM {statement.split()[-1]}")
+        elif statement.startswith('LOAD DATA'):
+            self._load_data(statement, params[0])
+        else:
+            if statement.startswith('SAVEPOINT') and not self.sqlite.in_transaction:
+                self.sqlite.execute("BEGIN")
+            statement = statement.replace('%s', '?')
+            if 'ON DUPLICATE KEY UPDATE' in statement:
+                statement = re.sub(r"VALUES\((\w+)\)", r"excluded.\1",
+                                   statement.replace('ON DUPLICATE KEY UPDATE', 'ON CONFLICT DO UPDATE SET'))
+            try:
+                cursor = self.sqlite.execute(statement, [self._adapt(value) for value in params or ()])
+            except sqlite3.IntegrityError as e:
+                raise constraint_error(e) from e
+            self.rowcount = cursor.rowcount
+            self.results = cursor.fetchall() if statement.startswith('SELECT') else []
+
+    def _load_data(self, statement, path):
+        table, columns = LOAD_DATA.match(statement).groups()
+        columns = [column.strip() for column in columns.split(',')]
+        rows = []
+        with open(path, encoding='utf-8', newline='') as f:
+            for line in f:
+                rows.append([
+                    None if field == '\\N' else re.sub(r"\\[\\tnr0]", lambda m: TSV_UNESCAPES[m.group()], field)
+                    for field in line.rstrip('\n').split('\t')
+                ])
+        insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+        self.sqlite.execute("SAVEPOINT load_data")
+        try:
+            self.sqlite.executemany(insert, rows)
+            self.rowcount = len(rows)
+        except sqlite3.IntegrityError:
+            # Like a LOCAL load in MySQL, go on past bad rows with a warning
+            # each: a duplicate key skips the row, a value that breaks a
+            # CHECK is stored anyway, as MySQL would store it truncated
+            self.sqlite.execute("ROLLBACK TO SAVEPOINT load_data")
+            self.rowcount = 0
+            for number, row in enumerate(rows, 1):
+                try:
+                    self.sqlite.execute(insert, row)
+                except sqlite3.IntegrityError as e:
+                    duplicate = 'UNIQUE' in str(e)
+                    self.warnings.append(('Warning', 1062 if duplicate else 1265, f"{e} at row {number}"))
+                    if duplicate:
+                        continue
+                    self.sqlite.execute("PRAGMA ignore_check_constraints = ON")
+                    try:
+                        self.sqlite.execute(insert, row)
+                    finally:
+                        self.sqlite.execute("PRAGMA ignore_check_constraints = OFF")
+                self.rowcount += 1
+        self.sqlite.execute("RELEASE SAVEPOINT load_data")
+
+    @staticmethod
+    def _adapt(value):
+        if isinstance(value, datetime):
+            return value.isoformat(' ')
+        return value
+
+    def fetchone(self):
+        return self.results.pop(0) if self.results else None
+
+    def fetchall(self):
+        results, self.results = self.results, []
+        return results
+
+    def fetchmany(self, size):
+        results, self.results = self.results[:size], self.results[size:]
+        return results
+
+    def close(self):
+        pass
+
+# Running and reporting
+
+def migration_order(names):
+    """Return the migrations to run for `names`, dependencies first"""
+    order = []
+
+    def visit(name):
+        if name in order:
+            return
+        for dependency in importer.MIGRATIONS[name][1]:
+            visit(dependency)
+        order.append(name)
+
+    for name in names:
+        visit(name)
+    return order
+
+def count_documents(path):
+    return sum(1 for _ in importer.read_raw_bson_file(str(path))) if path.exists() else 0
+
+def run_benchmark(dump_path, use_mysql=False, only=None, verbose=False):
+    """Run the migrations against the dump and return per-collection results"""
+    stats = Statistics()
+    if use_mysql:
+        # Connections come from a fresh connection each time, so the
+        # importer's session handling still runs against the server
+        connect = importer.get_mysql_connection
+    else:
+        connect = StandInDatabase().connect
+    pool = CountingPool(connect, stats)
+    importer.get_connection_pool = lambda: pool
+    importer.MONGO_BACKUP_PATH = str(dump_path)
+    importer.CHECKPOINT_PATH = Path(tempfile.mkdtemp(prefix='benchmark-checkpoint-'))
+    importer.DEAD_LETTER_PATH = Path(tempfile.mkdtemp(prefix='benchmark-dead-letter-'))
+
+    def output():
+        # The importer prints a line for every skipped or failed document
+        return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+    with output():
+        importer.ensure_sync_tables()
+        importer.truncate_all_tables()
+        importer.reset_checkpoints()
+
+    results = {}
+    for name in migration_order(only or list(importer.MIGRATIONS)):
+        bson_file = dump_path / f"{MIGRATION_FILES[name]}.bson"
+        statements, commits, rows = stats.statements, stats.commits, Counter(stats.rows)
+        rss_before = importer.peak_rss_mb()
+        started = time.perf_counter()
+        with output():
+            importer.run_stage(name, importer.MIGRATIONS[name][0])
+        elapsed = time.perf_counter() - started
+
+        written = {
+            table: count - rows[table] for table, count in stats.rows.items()
+            if count > rows[table] and table not in (importer.ID_MAP_TABLE, importer.WATERMARK_TABLE)
+        }
+        documents = count_documents(bson_file)
+        results[name] = {
+            'documents': documents,
+            'bytes': bson_file.stat().st_size if bson_file.exists() else 0,
+            'rows': sum(written.values()),
+            'rows_by_table': written,
+            'rows_failed': sum(importer.stages[name].failed.values()),
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(sum(written.values()) / elapsed, 1) if elapsed else None,
+            'documents_per_second': round(documents / elapsed, 1) if elapsed else None,
+            'round_trips': stats.statements - statements + stats.commits - commits,
+            'peak_rss_mb': round(importer.peak_rss_mb(), 1),
+            'rss_growth_mb': round(importer.peak_rss_mb() - rss_before, 1),
+        }
+        print(f"{name:<25} {results[name]['rows']:>9} rows {elapsed:>8.2f}s "
+              f"{results[name]['rows_per_second'] or 0:>10.0f} rows/s {results[name]['round_trips']:>7} round trips "
+              f"{results[name]['peak_rss_mb']:>7.1f} MB")
+
+    if importer._process_pool is not None:
+        importer._process_pool.shutdown()
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=IMPORTER_PATH.parent,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_results(results, scale, seed, dirty, target):
+    """Write a run's results to RESULTS_PATH and return the file"""
+    RESULTS_PATH.mkdir(parents=True, exist_ok=True)
+    revision = git_revision()
+    created = datetime.now()
+    report = {
+        'created': created.isoformat(timespec='seconds'),
+        'revision': revision,
+        'target': target,
+        'scale': scale,
+        'seed': seed,
+        'dirty': dirty,
+        'python': sys.version.split()[0],
+        'cpus': os.cpu_count(),
+        'collections': results,
+        'total': {
+            'rows': sum(result['rows'] for result in results.values()),
+            'seconds': round(sum(result['seconds'] for result in results.values()), 3),
+            'round_trips': sum(result['round_trips'] for result in results.values()),
+            'rows_failed': sum(result['rows_failed'] for result in results.values()),
+            'peak_rss_mb': max((result['peak_rss_mb'] for result in results.values()), default=0),
+        },
+    }
+    path = RESULTS_PATH / f"{created:%Y%m%d-%H%M%S}-{revision or 'unknown'}-{target}.json"
+    path.write_text(json.dumps(report, indent=2))
+    return path, report
+
+def compare_results(previous_path, report):
+    """Print how each collection's throughput changed against an earlier report"""
+    previous = json.loads(Path(previous_path).read_text())
+    print(f"Compared with {previous.get('revision')} ({previous.get('created')}):")
+    for name, result in report['collections'].items():
+        before = previous['collections'].get(name)
+        if not before or not before.get('rows_per_second') or result['rows_per_second'] is None:
+            continue
+        change = (result['rows_per_second'] / before['rows_per_second'] - 1) * 100
+        print(f"  {name:<25} {before['rows_per_second']:>10.0f} -> {result['rows_per_second']:>10.0f} rows/s ({change:+.1f}%)"
+              f"  round trips {before['round_trips']} -> {result['round_trips']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the MongoDB to MySQL importer on synthetic data")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="multiply the default collection sizes by this factor")
+    parser.add_argument('--seed', type=int, default=42, help="random seed of the generated dump")
+    parser.add_argument('--dirty', type=float, default=0.0,
+                        help="share of campaigns and products whose title is too long for the database")
+    parser.add_argument('--only', help="comma-separated migrations to run (their dependencies run too)")
+    parser.add_argument('--mysql', action='store_true',
+                        help="load into the server in MYSQL_CONFIG instead of the SQLite stand-in; its tables are truncated")
+    parser.add_argument('--pure', action='store_true',
+                        help="connect with the pure Python protocol implementation instead of the C extension")
+    parser.add_argument('--compare', metavar='REPORT', help="earlier results file to compare against")
+    parser.add_argument('--verbose', action='store_true', help="show the importer's own output")
+    args = parser.parse_args()
+
+    if args.pure and not args.mysql:
+        parser.error("--pure needs --mysql; the stand-in doesn't use the connector")
+    importer.USE_PURE = args.pure
+    only = args.only.split(',') if args.only else None
+    for name in only or []:
+        if name not in importer.MIGRATIONS:
+            parser.error(f"unknown migration {name}")
+
+    dump_path = get_dump(args.scale, args.seed, args.dirty)
+    target = ('mysql-pure' if args.pure else 'mysql') if args.mysql else 'stand-in'
+    print(f"Running migrations against the {target}...")
+    results = run_benchmark(dump_path, use_mysql=args.mysql, only=only, verbose=args.verbose)
+    path, report = save_results(results, args.scale, args.seed, args.dirty, target)
+    print(f"Total: {report['total']['rows']} rows in {report['total']['seconds']:.1f}s, "
+          f"{report['total']['round_trips']} round trips, {report['total']['rows_failed']} rejected, "
+          f"peak {report['total']['peak_rss_mb']:.1f} MB")
+    print(f"Results saved to {path}")
+    if args.compare:
+        compare_results(args.compare, report)
@@ -4,13 +4,41 @@ MongoDB to MySQL Migration Script v2
 Converts MongoDB BSON backup files to MySQL without ID conflicts
 """
 
+import argparse
+import bisect
+import csv
+import gzip
+import itertools
 import json
+import multiprocessing
 import mysql.connector
+from mysql.connector import pooling
+from collections import Counter, deque
 from datetime import datetime
 import os
+import resource
+import shutil
+import sqlite3
+import struct
+import sys
+from array import array
 from pathlib import Path
-from bson import decode_all, ObjectId
+from bson import decode, decode_file_iter, Decimal128, ObjectId
+from bson.errors import InvalidId
 import hashlib
+import tempfile
+import time
+import threading
+import zlib
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 # Configuration
 MONGO_BACKUP_PATH = "/Users/erayusta/code/kampanyaradar-project/docs/mongodb_backup/kampanyaradar"
@@ -22,81 +50,1930 @@ MYSQL_CONFIG = {
     'port': 3307
 }
 
+# Rows per multi-row INSERT; a batch is also cut short before it would
+# exceed the server's max_allowed_packet
+BATCH_SIZE = 1000
+PACKET_HEADROOM = 64 * 1024
+
+# Pivot rows are a few bytes each: their writers hold up to PIVOT_BATCH_SIZE
+# rows, normally everything between two checkpoints, and write them right
+# after the parent rows they point at
+PIVOT_BATCH_SIZE = 50000
+
+# Lookup data (product GTINs, saved id mappings) is streamed from MySQL in
+# chunks of this many rows; skipped price histories are summarised with the
+# most frequent unknown GTINs
+FETCH_SIZE = 10000
+MISSING_GTIN_EXAMPLES = 10
+
+# Bulk-load mode (--load-mode): 'insert' writes every table with multi-row
+# INSERTs, 'infile' streams the largest tables through LOAD DATA LOCAL INFILE
+# instead
+LOAD_MODE = 'insert'
+INFILE_TABLES = {
+    'products', 'product_price_histories', 'leads', 'campaigns',
+    'campaign_brand', 'campaign_category', 'category_post'
+}
+INFILE_BATCH_SIZE = 50000
+INFILE_MAX_BYTES = 256 * 1024 * 1024
+
+# --export writes the rows to files under EXPORT_PATH instead of MySQL: one
+# directory per table with a CSV or Parquet part file for every
+# EXPORT_BATCH_SIZE rows (Parquet needs pyarrow)
+EXPORT_PATH = Path(__file__).resolve().parent / 'export'
+EXPORT_BATCH_SIZE = 100000
+EXPORT_MAX_BYTES = 256 * 1024 * 1024
+
+# --export sql writes a gzipped script to EXPORT_PATH / DUMP_FILENAME instead,
+# with INSERTs of up to DUMP_BATCH_SIZE rows and DUMP_MAX_BYTES (well below
+# the client's default max_allowed_packet), committed every DUMP_COMMIT_EVERY
+DUMP_FILENAME = 'migration.sql.gz'
+DUMP_BATCH_SIZE = 10000
+DUMP_MAX_BYTES = 4 * 1024 * 1024
+DUMP_COMMIT_EVERY = 50
+
+# Migrations that run at the same time, each on its own connection
+MAX_WORKERS = 4
+
+# Products and cars are decoded and converted to rows in worker processes,
+# PIPELINE_CHUNK documents at a time; at most PIPELINE_DEPTH chunks per
+# collection are in flight, which bounds memory when MySQL is the bottleneck
+PIPELINE_PROCESSES = os.cpu_count() or 1
+PIPELINE_CHUNK = 500
+PIPELINE_DEPTH = PIPELINE_PROCESSES * 2
+
+# --ranges N splits the BSON files of the append-only collections in
+# RANGE_LOADERS into N contiguous ranges of about the same size, each loaded
+# by its own process on its own connection
+RANGES = 1
+
+# Connections are borrowed from a shared pool; USE_PURE = True (--pure)
+# switches from the C extension to the pure Python protocol implementation
+POOL_SIZE = MAX_WORKERS + 1
+POOL_WAIT_SECONDS = 300
+USE_PURE = False
+
+# Session settings applied to pooled connections while they load data and
+# restored before the connection goes back to the pool. Settings the account
+# isn't permitted to change (sql_log_bin needs SYSTEM_VARIABLES_ADMIN) are
+# skipped with a warning the first time and not tried again.
+# unique_checks stays on: turning it off only defers the checks of unique
+# secondary indexes, and with them off InnoDB may accept duplicate emails
+# and slugs. Tables without such an index gain nothing from it.
+LOAD_SESSION_SETTINGS = {
+    'autocommit': 0,
+    'foreign_key_checks': 0,
+    'sql_log_bin': 0,
+    'transaction_isolation': 'READ-COMMITTED',
+}
+
+# With --rebuild-indexes the non-unique secondary indexes and foreign keys of
+# these tables are dropped for the load and recreated afterwards, one table
+# per connection. Their definitions are kept in INDEX_DDL_PATH until then, so
+# the next run restores them if this one is killed.
+INDEX_REBUILD_TABLES = [
+    'campaigns', 'products', 'product_price_histories', 'leads',
+    'campaign_brand', 'campaign_category', 'category_post'
+]
+INDEX_DDL_PATH = Path(__file__).resolve().parent / 'migration-indexes.json'
+
+# Progress of each migration is saved here so an interrupted run can be
+# continued with --resume; rows are committed every CHECKPOINT_EVERY documents
+CHECKPOINT_PATH = Path(__file__).resolve().parent / 'migration-checkpoint'
+CHECKPOINT_EVERY = 10000
+
+# Offset indexes of the BSON files are kept in BSON_INDEX_PATH, one per file,
+# and rebuilt when the file's size or modification time changes. A resumed
+# run seeks past the committed documents with them and --ranges splits files
+# along them, both without decoding anything.
+BSON_INDEX_PATH = Path(__file__).resolve().parent / 'bson-index'
+
+# Running migrations report their progress every PROGRESS_INTERVAL seconds;
+# the metrics of every stage are written to REPORT_PATH at the end of a run
+PROGRESS_INTERVAL = 10
+REPORT_PATH = Path(__file__).resolve().parent / 'migration-report.json'
+
+# Documents whose rows the database rejects are copied to DEAD_LETTER_PATH,
+# into a BSON file per collection named like the dump's, and every rejected
+# row is logged with its error to DEAD_LETTER_LOG there. --replay migrates
+# those files again once the cause is fixed.
+DEAD_LETTER_PATH = Path(__file__).resolve().parent / 'dead-letter'
+DEAD_LETTER_LOG = 'errors.jsonl'
+
+# --verify reconciles the tables in VERIFY_COLUMNS with their BSON files after
+# the load. Both sides are totalled per block of VERIFY_RANGE ids: the row
+# count and, for every listed column, the number of non-NULL values and the
+# sum of their CRC32s. Only blocks whose totals differ are compared document
+# by document. Columns are listed as (document field, value the migration
+# writes when the field is missing). The first VERIFY_EXAMPLES problems per
+# table are printed and all of them are written to VERIFY_REPORT_PATH.
+VERIFY_RANGE = 10000
+VERIFY_EXAMPLES = 10
+VERIFY_REPORT_PATH = Path(__file__).resolve().parent / 'migration-verify.json'
+VERIFY_COLUMNS = {
+    'users': {
+        'first_name': ('firstName', ''), 'last_name': ('lastName', ''),
+        'email': ('email', ''), 'phone': ('phone', ''), 'role': ('role', 'user'),
+    },
+    'categories': {'name': ('name', ''), 'content': ('content', ''), 'description': ('description', '')},
+    'brands': {'name': ('name', ''), 'content': ('content', '')},
+    'campaigns': {
+        'title': ('title', ''), 'content': ('content', ''), 'link': ('link', None),
+        'item_type': ('itemType', 'general'), 'coupon_code': ('couponCode', None),
+    },
+    'posts': {'title': ('title', ''), 'content': ('content', '')},
+    'lead_forms': {'name': ('name', ''), 'description': ('description', ''), 'button_text': ('buttonText', 'Gönder')},
+    'pages': {'title': ('title', ''), 'content': ('content', '')},
+    'banks': {'content': ('content', '')},
+    'sliders': {'name': ('name', ''), 'image': ('image', None), 'link': ('link', None)},
+    'ads': {
+        'name': ('name', ''), 'type': ('type', ''), 'item_type': ('itemType', ''),
+        'link': ('link', None), 'code': ('code', None),
+    },
+    'products': {'title': ('title', None), 'gtin': ('gtin', '')},
+    'product_price_histories': {'gtin': ('gtin', ''), 'store_brand': ('storeBrand', '')},
+    'cars': {'model': ('model', ''), 'brand': ('brand', '')},
+    'real_estates': {'name': ('name', ''), 'city': ('city', ''), 'district': ('district', '')},
+    'attributes': {'name': ('name', ''), 'type': ('type', '')},
+    # Leads only hold JSON and foreign keys, so only their rows are checked
+    'leads': {},
+}
+# Documents the migration skips on purpose aren't reported as not migrated:
+# those whose value of the column isn't in the other table's column of the
+# same name (price histories of a GTIN no product has)
+VERIFY_SKIPS = {
+    'product_price_histories': ('gtin', 'products'),
+}
+
+# Mappings of these tables are never looked up by a later migration, so they
+# are kept in temporary SQLite files instead of memory
+MAPPING_SPILL_TABLES = {'products', 'product_price_histories', 'leads'}
+
+# Every migrated document's MySQL id and each collection's newest updatedAt
+# are stored in these tables, so an --incremental run can upsert only the
+# documents changed since the previous run
+ID_MAP_TABLE = 'mongo_import_ids'
+WATERMARK_TABLE = 'mongo_import_watermarks'
+SYNC_TABLE_DDL = [
+    f"""CREATE TABLE IF NOT EXISTS {ID_MAP_TABLE} (
+        table_name VARCHAR(64) NOT NULL,
+        mongo_id BINARY(12) NOT NULL,
+        mysql_id BIGINT UNSIGNED NOT NULL,
+        PRIMARY KEY (table_name, mongo_id)
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+        collection VARCHAR(64) NOT NULL PRIMARY KEY,
+        updated_at DATETIME(3) NOT NULL
+    )""",
+]
+
+# Tables a fresh run empties first; 'settings' is not truncated as it has
+# default values from migration
+MIGRATED_TABLES = [
+    'campaign_brand', 'campaign_category', 'category_post',
+    'leads', 'campaigns', 'brands', 'categories', 'users',
+    'lead_forms', 'banks', 'posts', 'pages', 'sliders',
+    'ads', 'products', 'product_price_histories', 'cars',
+    'real_estates', 'attributes'
+]
+
+# The dump file each table's rows come from
+SOURCE_FILES = {
+    'users': 'User.bson', 'categories': 'Category.bson', 'brands': 'Brand.bson',
+    'campaigns': 'Campaign.bson', 'posts': 'Post.bson', 'lead_forms': 'LeadForm.bson',
+    'pages': 'Page.bson', 'banks': 'Bank.bson', 'sliders': 'Slider.bson', 'ads': 'Ads.bson',
+    'products': 'Product.bson', 'product_price_histories': 'ProductPriceHistory.bson',
+    'cars': 'Car.bson', 'real_estates': 'RealEstate.bson', 'attributes': 'Attribute.bson',
+    'leads': 'Lead.bson',
+}
+
+MAPPING_KEY = struct.Struct('>QI')
+MAPPING_RECORD = struct.Struct('>12sQ')
+BSON_INDEX_HEADER = struct.Struct('<8sQqQ')
+BSON_INDEX_MAGIC = b'BSONIDX2'
+
+def object_id_bytes(value):
+    """Return the raw 12 bytes of an ObjectId given as ObjectId, hex string or bytes"""
+    if isinstance(value, ObjectId):
+        return value.binary
+    if isinstance(value, str):
+        return ObjectId(value).binary
+    if isinstance(value, bytes) and len(value) == 12:
+        return value
+    raise TypeError(f"Not an ObjectId: {value!r}")
+
+class IdMapping:
+    """Compact MongoDB ObjectId -> MySQL id map
+
+    Keys are the raw 12-byte ObjectIds, split into a 64-bit and a 32-bit
+    integer and kept in an open-addressing hash table of flat arrays: 20
+    bytes per slot instead of the few hundred a dict of hex strings costs.
+    With spill=True the entries live in a temporary SQLite file instead and
+    lookups go through its primary key index.
+
+    Entries added since the last checkpoint are collected in `pending` as
+    (raw key, id) pairs.
+    """
+
+    INITIAL_SLOTS = 1024
+    SPILL_BUFFER = 10000
+
+    def __init__(self, spill=False):
+        self.spill = spill
+        self.pending = []
+        self._lock = threading.Lock()
+        self._db = None
+        self._spill_buffer = []
+        self._reset(self.INITIAL_SLOTS)
+
+    def _reset(self, slots):
+        self._mask = slots - 1
+        self._high = array('Q', bytes(8 * slots))
+        self._low = array('I', bytes(4 * slots))
+        self._ids = array('Q', bytes(8 * slots))
+        self._count = 0
+
+    def _slot(self, high, low):
+        """Return the slot holding the key, or the empty slot where it belongs"""
+        mask, ids, highs, lows = self._mask, self._ids, self._high, self._low
+        slot = hash((high, low)) & mask
+        while ids[slot] and (highs[slot] != high or lows[slot] != low):
+            slot = (slot + 1) & mask
+        return slot
+
+    def _spill_db(self):
+        if self._db is None:
+            # An empty filename gives a private on-disk database that SQLite
+            # deletes when the connection closes
+            self._db = sqlite3.connect('', check_same_thread=False)
+            self._db.execute("CREATE TABLE mapping (mongo_id BLOB PRIMARY KEY, mysql_id INTEGER) WITHOUT ROWID")
+        if self._spill_buffer:
+            self._db.executemany("INSERT OR REPLACE INTO mapping VALUES (?, ?)", self._spill_buffer)
+            self._spill_buffer = []
+        return self._db
+
+    def _store(self, binary, mysql_id):
+        if self.spill:
+            self._spill_buffer.append((binary, mysql_id))
+            if len(self._spill_buffer) >= self.SPILL_BUFFER:
+                with self._lock:
+                    self._spill_db()
+            return
+        high, low = MAPPING_KEY.unpack(binary)
+        slot = self._slot(high, low)
+        if not self._ids[slot]:
+            self._count += 1
+        self._high[slot] = high
+        self._low[slot] = low
+        self._ids[slot] = mysql_id
+        # Keep the table at most 60% full so probe chains stay short
+        if self._count * 5 > len(self._ids) * 3:
+            entries = list(self._entries())
+            self._reset(len(self._ids) * 2)
+            for binary, mysql_id in entries:
+                self._store(binary, mysql_id)
+
+    def _entries(self):
+        for slot, mysql_id in enumerate(self._ids):
+            if mysql_id:
+                yield MAPPING_KEY.pack(self._high[slot], self._low[slot]), mysql_id
+
+    def __setitem__(self, key, mysql_id):
+        binary = object_id_bytes(key)
+        self._store(binary, mysql_id)
+        self.pending.append((binary, mysql_id))
+
+    def restore(self, records):
+        """Add (raw key, id) pairs without recording them as pending"""
+        for binary, mysql_id in records:
+            self._store(binary, mysql_id)
+
+    def get(self, key, default=None):
+        """Return the MySQL id for an ObjectId, or default if it isn't mapped"""
+        try:
+            binary = object_id_bytes(key)
+        except (InvalidId, TypeError):
+            return default
+        if self.spill:
+            with self._lock:
+                row = self._spill_db().execute(
+                    "SELECT mysql_id FROM mapping WHERE mongo_id = ?", (binary,)
+                ).fetchone()
+            return row[0] if row else default
+        mysql_id = self._ids[self._slot(*MAPPING_KEY.unpack(binary))]
+        return mysql_id or default
+
+    def get_many(self, keys):
+        """Return the MySQL ids of the keys that are mapped, in order"""
+        return [mysql_id for mysql_id in map(self.get, keys) if mysql_id is not None]
+
+    def __getitem__(self, key):
+        mysql_id = self.get(key)
+        if mysql_id is None:
+            raise KeyError(key)
+        return mysql_id
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        if self.spill:
+            with self._lock:
+                return self._spill_db().execute("SELECT COUNT(*) FROM mapping").fetchone()[0]
+        return self._count
+
+    def records(self):
+        """Return (raw key, id) pairs for every entry"""
+        if self.spill:
+            with self._lock:
+                return self._spill_db().execute("SELECT mongo_id, mysql_id FROM mapping").fetchall()
+        return list(self._entries())
+
+    def items(self):
+        """Yield (ObjectId, MySQL id) pairs"""
+        for binary, mysql_id in self.records():
+            yield ObjectId(binary), mysql_id
+
+    def clear(self):
+        self.pending = []
+        self._spill_buffer = []
+        if self._db is not None:
+            self._db.execute("DELETE FROM mapping")
+        self._reset(self.INITIAL_SLOTS)
+
 # ID mapping to track MongoDB ObjectId to MySQL ID conversions
 id_mappings = {
-    'users': {},
-    'categories': {},
-    'brands': {},
-    'campaigns': {},
-    'lead_forms': {},
-    'banks': {},
-    'posts': {},
-    'pages': {},
-    'sliders': {},
-    'ads': {},
-    'products': {},
-    'cars': {},
-    'real_estates': {},
-    'attributes': {},
-    'leads': {}
+    table: IdMapping(spill=table in MAPPING_SPILL_TABLES)
+    for table in (
+        'users', 'categories', 'brands', 'campaigns', 'lead_forms',
+        'banks', 'posts', 'pages', 'sliders', 'ads', 'products',
+        'product_price_histories', 'cars', 'real_estates', 'attributes', 'leads',
+        # Brand documents folded into an earlier brand of the same name
+        'brand_duplicates'
+    )
 }
 
-def read_bson_file(filepath):
-    """Read BSON file and return documents"""
+def peak_rss_mb():
+    """Return the highest resident set size of the process so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+class Stage:
+    """Metrics of one migration, updated by the thread that runs it
+
+    Documents and bytes are counted as the BSON file is read, rows as
+    writers flush them and SQL statements from the server's Questions
+    counter of each session the migration opens. Rows the database
+    rejected are counted as failed; documents of the migration's main
+    table that produced neither a row nor a failure count as skipped.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.table = None
+        self.status = 'running'
+        self.file_size = 0
+        self.documents = 0
+        self.bytes_read = 0
+        self.rows = Counter()
+        self.failed = Counter()
+        self.statements = 0
+        self.started = time.monotonic()
+        self.finished = None
+        self.next_progress = self.started + PROGRESS_INTERVAL
+
+    def read(self, position):
+        """Count a document read from the BSON file, which ends at `position`"""
+        self.documents += 1
+        self.bytes_read = position
+        if time.monotonic() >= self.next_progress:
+            self.next_progress = time.monotonic() + PROGRESS_INTERVAL
+            self.print_progress()
+
+    def print_progress(self):
+        elapsed = time.monotonic() - self.started
+        rows = sum(self.rows.values())
+        line = f"{self.name}: {self.documents} documents, {rows} rows ({rows / elapsed:.0f} rows/s)"
+        if self.file_size and self.bytes_read:
+            done = self.bytes_read / self.file_size
+            eta = elapsed * (self.file_size - self.bytes_read) / self.bytes_read
+            line += f", {done:.1%} of {self.file_size / 1024 / 1024:.0f} MB, ETA {format_duration(eta)}"
+        print(line)
+
+    def finish(self, status):
+        self.status = status
+        self.finished = time.monotonic()
+
+    def merge(self, other):
+        """Add the counts of a stage that ran part of this one elsewhere"""
+        self.documents += other.documents
+        self.bytes_read += other.bytes_read
+        self.rows.update(other.rows)
+        self.failed.update(other.failed)
+        self.statements += other.statements
+
+    def report(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        rows = sum(self.rows.values())
+        skipped = 0
+        if self.table:
+            skipped = max(0, self.documents - self.rows[self.table] - self.failed[self.table])
+        return {
+            'status': self.status,
+            'documents_read': self.documents,
+            'bytes_decoded': self.bytes_read,
+            'rows_written': rows,
+            'rows_by_table': dict(self.rows),
+            'rows_skipped': skipped,
+            'rows_failed': sum(self.failed.values()),
+            'sql_statements': self.statements,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed, 1) if elapsed else None,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+
+# Stages of the current run by migration name, and the one running on each thread
+stages = {}
+_current_stage = threading.local()
+
+def current_stage():
+    """Return the Stage of the migration running on this thread, if any"""
+    return getattr(_current_stage, 'stage', None)
+
+def run_stage(name, migrate):
+    """Run a migration function with its own Stage collecting metrics"""
+    stage = stages[name] = Stage(name)
+    _current_stage.stage = stage
+    try:
+        migrate()
+        stage.finish('done')
+    except Exception:
+        stage.finish('failed')
+        raise
+    finally:
+        _current_stage.stage = None
+
+class BsonIndex:
+    """Offsets of the documents in a BSON file
+
+    `offsets` holds the start of every document followed by the end of
+    the last one, so document n is the bytes offsets[n]:offsets[n + 1].
+    """
+
+    def __init__(self, offsets):
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def offset(self, position):
+        """Return where document `position` starts, or the end of the last document"""
+        return self.offsets[min(position, len(self))]
+
+def scan_bson_file(filepath):
+    """Build a BsonIndex of a BSON file from its length prefixes alone
+
+    A truncated or corrupt document ends the index, as it ends reading
+    the file.
+    """
+    file_size = os.path.getsize(filepath)
+    offsets = array('Q', [0])
+    position = 0
     with open(filepath, 'rb') as f:
-        data = f.read()
+        while position < file_size:
+            header = f.read(4)
+            size = int.from_bytes(header, 'little')
+            if len(header) < 4 or size < 5 or position + size > file_size:
+                print(f"Error reading {filepath}: invalid document length at byte {position}")
+                break
+            position += size
+            offsets.append(position)
+            f.seek(position)
+    return BsonIndex(offsets)
+
+def bson_index_path(filepath):
+    # Files of the same name in different directories (a dump and its dead
+    # letters) get separate indexes
+    directory = hashlib.sha1(str(Path(filepath).resolve().parent).encode()).hexdigest()[:8]
+    return BSON_INDEX_PATH / f"{Path(filepath).name}.{directory}.idx"
+
+def load_bson_index(filepath):
+    """Return the BsonIndex of a BSON file, building and saving it if needed
+
+    A saved index is used only if it was built from a file of the same
+    size and modification time.
+    """
+    stat = os.stat(filepath)
+    index_path = bson_index_path(filepath)
+    try:
+        with open(index_path, 'rb') as f:
+            magic, file_size, mtime_ns, count = BSON_INDEX_HEADER.unpack(f.read(BSON_INDEX_HEADER.size))
+            if magic == BSON_INDEX_MAGIC and file_size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+                offsets = array('Q')
+                offsets.frombytes(f.read((count + 1) * offsets.itemsize))
+                if len(offsets) == count + 1:
+                    return BsonIndex(offsets)
+    except (FileNotFoundError, struct.error):
+        pass
+
+    index = scan_bson_file(filepath)
+    BSON_INDEX_PATH.mkdir(exist_ok=True)
+    tmp_path = index_path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(BSON_INDEX_HEADER.pack(BSON_INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(index)))
+        f.write(index.offsets.tobytes())
+    os.replace(tmp_path, index_path)
+    return index
+
+def read_bson_file(filepath, start=0, end=None, skip=0):
+    """Stream documents from a BSON file one at a time
+
+    Only the document currently being decoded is held in memory, so peak
+    usage depends on what the caller buffers rather than on the file size.
+    `start` and `end` limit reading to a range of whole documents; `skip`
+    seeks past that many documents at the start of the file instead. Each
+    document gets the byte offset it starts at as `_offset`.
+    """
+    if skip:
+        start = load_bson_index(filepath).offset(skip)
+    stage = current_stage()
+    with open(filepath, 'rb') as f:
+        if stage:
+            stage.file_size = (end or os.fstat(f.fileno()).st_size) - start
+        f.seek(start)
+        offset = start
         try:
-            return decode_all(data)
+            for doc in decode_file_iter(f):
+                doc['_offset'] = offset
+                offset = f.tell()
+                if stage:
+                    stage.read(offset - start)
+                yield doc
+                if end is not None and f.tell() >= end:
+                    break
         except Exception as e:
             print(f"Error reading {filepath}: {e}")
-            return []
-
-def convert_objectid_to_string(obj):
-    """Recursively convert ObjectId to string"""
-    if isinstance(obj, ObjectId):
-        return str(obj)
-    elif isinstance(obj, dict):
-        return {k: convert_objectid_to_string(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_objectid_to_string(item) for item in obj]
-    elif isinstance(obj, datetime):
-        return obj.strftime('%Y-%m-%d %H:%M:%S')
-    return obj
+
+def read_bson_documents(filepath, positions, index=None):
+    """Decode the documents at the given positions of a BSON file, in that order"""
+    index = index or load_bson_index(filepath)
+    with open(filepath, 'rb') as f:
+        for position in positions:
+            start = index.offset(position)
+            f.seek(start)
+            yield decode(f.read(index.offset(position + 1) - start))
+
+def split_bson_file(filepath, parts, skip=0):
+    """Split a BSON file into up to `parts` ranges of whole documents
+
+    Ranges are cut along the file's BsonIndex. Returns a (start, end,
+    documents) tuple per range; the ranges are contiguous, of roughly
+    equal size and cover the file after its first `skip` documents.
+    """
+    index = load_bson_index(filepath)
+    offsets = index.offsets
+    first = min(skip, len(index))
+    origin = offsets[first]
+    range_size = (offsets[-1] - origin) / parts
+    ranges = []
+    while first < len(index):
+        if len(ranges) < parts - 1:
+            last = bisect.bisect_left(offsets, origin + range_size * (len(ranges) + 1), first + 1)
+        else:
+            last = len(index)
+        ranges.append((offsets[first], offsets[last], last - first))
+        first = last
+    return ranges
+
+def read_raw_bson_file(filepath, skip=0):
+    """Stream the documents of a BSON file as undecoded bytes, after the first `skip`"""
+    start = load_bson_index(filepath).offset(skip) if skip else 0
+    stage = current_stage()
+    with open(filepath, 'rb') as f:
+        if stage:
+            stage.file_size = os.fstat(f.fileno()).st_size - start
+        f.seek(start)
+        while True:
+            header = f.read(4)
+            if not header:
+                break
+            size = int.from_bytes(header, 'little')
+            body = f.read(size - 4) if len(header) == 4 else b''
+            if len(header) < 4 or len(body) < size - 4:
+                print(f"Error reading {filepath}: truncated document")
+                break
+            if stage:
+                stage.read(f.tell() - start)
+            yield header + body
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def get_process_pool():
+    """Start the shared worker processes on first use"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # Spawned rather than forked: forking a process whose other
+            # threads hold MySQL connections and locks isn't safe
+            _process_pool = ProcessPoolExecutor(
+                max_workers=PIPELINE_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _process_pool
+
+def prepare_chunk(prepare, raw_documents, since=None, offset=0):
+    """Decode raw documents and run `prepare` on each, in a worker process
+
+    Documents last updated at or before `since` are only reduced to their
+    _id and timestamp, since an incremental run drops them anyway. A
+    document `prepare` fails on is returned as is with an `_error` message.
+    Like read_bson_file(), every result gets the `_offset` its document
+    starts at, the chunk starting at `offset`.
+    """
+    prepared = []
+    for raw in raw_documents:
+        try:
+            doc = decode(raw)
+        except Exception as e:
+            prepared.append({'_read_error': str(e)})
+            break
+        stamp = document_timestamp(doc)
+        if since is not None and stamp is not None and stamp <= since:
+            result = {'_id': doc['_id'], 'updatedAt': stamp}
+        else:
+            try:
+                result = prepare(doc)
+            except Exception as e:
+                doc['_error'] = str(e)
+                result = doc
+        result['_offset'] = offset
+        offset += len(raw)
+        prepared.append(result)
+    return prepared
+
+def prepare_in_processes(filepath, prepare, since=None, skip=0):
+    """Yield the documents of a BSON file, decoded and prepared by worker processes
+
+    Raw documents go to the process pool in chunks and come back in file
+    order. While the caller writes one chunk to MySQL the workers convert
+    the next ones; once PIPELINE_DEPTH chunks are waiting, reading pauses
+    until the caller catches up.
+    """
+    pool = get_process_pool()
+    raw_documents = read_raw_bson_file(filepath, skip)
+    offset = load_bson_index(filepath).offset(skip) if skip else 0
+    in_flight = deque()
+    try:
+        while True:
+            while len(in_flight) < PIPELINE_DEPTH:
+                chunk = list(itertools.islice(raw_documents, PIPELINE_CHUNK))
+                if not chunk:
+                    break
+                in_flight.append(pool.submit(prepare_chunk, prepare, chunk, since, offset))
+                offset += sum(map(len, chunk))
+            if not in_flight:
+                break
+            for doc in in_flight.popleft().result():
+                if '_read_error' in doc:
+                    print(f"Error reading {filepath}: {doc['_read_error']}")
+                    return
+                yield doc
+    finally:
+        for future in in_flight:
+            future.cancel()
+        raw_documents.close()
+
+def bson_json_default(value):
+    """Convert the BSON values json can't encode itself
+
+    ObjectIds become their hex string and datetimes are written without
+    a timezone; Int64 is an int and needs nothing.
+    """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, Decimal128):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+# The C encoder walks dicts, lists and scalars itself and only calls back
+# into Python for the BSON types above
+_json_encoder = json.JSONEncoder(default=bson_json_default)
+
+def to_json(value):
+    """Encode a document value for a JSON column in a single pass"""
+    return _json_encoder.encode(value)
+
+def get_connection_options():
+    """Return connect() arguments for the configured server and transport"""
+    return dict(MYSQL_CONFIG, allow_local_infile=LOAD_MODE == 'infile', use_pure=USE_PURE)
 
 def get_mysql_connection():
     """Create MySQL connection"""
-    return mysql.connector.connect(**MYSQL_CONFIG)
+    return mysql.connector.connect(**get_connection_options())
 
-def truncate_all_tables():
-    """Truncate all tables to start fresh"""
-    conn = get_mysql_connection()
+_pool = None
+_pool_lock = threading.Lock()
+# LOAD_SESSION_SETTINGS the server refused once, skipped from then on
+_refused_settings = set()
+
+def get_connection_pool():
+    """Create the shared connection pool on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pooling.MySQLConnectionPool(
+                pool_name='mongo_import',
+                pool_size=POOL_SIZE,
+                pool_reset_session=True,
+                **get_connection_options()
+            )
+        return _pool
+
+def acquire_connection():
+    """Borrow a pooled connection, waiting while all of them are in use"""
+    pool = get_connection_pool()
+    deadline = time.monotonic() + POOL_WAIT_SECONDS
+    while True:
+        try:
+            return pool.get_connection()
+        except mysql.connector.errors.PoolError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+def apply_load_profile(conn):
+    """Apply LOAD_SESSION_SETTINGS and return the previous values"""
+    saved = {}
     cursor = conn.cursor()
-    
-    # Disable foreign key checks
-    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
-    
-    tables = [
-        'campaign_brand', 'campaign_category', 'category_post',
-        'leads', 'campaigns', 'brands', 'categories', 'users',
-        'lead_forms', 'banks', 'posts', 'pages', 'sliders',
-        'ads', 'products', 'product_price_histories', 'cars',
-        'real_estates', 'attributes'
-        # Note: 'settings' is not truncated as it has default values from migration
-    ]
-    
-    for table in tables:
+    for name, value in LOAD_SESSION_SETTINGS.items():
+        if name in _refused_settings:
+            continue
         try:
-            cursor.execute(f"TRUNCATE TABLE {table}")
-            print(f"Truncated table: {table}")
-        except Exception as e:
-            print(f"Error truncating {table}: {e}")
-    
-    # Re-enable foreign key checks
-    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
-    
-    conn.commit()
+            cursor.execute(f"SELECT @@SESSION.{name}")
+            previous = cursor.fetchone()[0]
+            cursor.execute(f"SET SESSION {name} = %s", (value,))
+            saved[name] = previous
+        except mysql.connector.Error as e:
+            _refused_settings.add(name)
+            print(f"Could not set {name} for bulk loading: {e}")
+    cursor.close()
+    return saved
+
+def restore_session(conn, saved):
+    """Put back the session values returned by apply_load_profile()"""
+    cursor = conn.cursor()
+    for name, value in reversed(list(saved.items())):
+        cursor.execute(f"SET SESSION {name} = %s", (value,))
     cursor.close()
-    conn.close()
+
+@contextmanager
+def load_session():
+    """Borrow a pooled connection tuned for bulk loading
+
+    Work that wasn't committed inside the block is rolled back. The original
+    session settings are restored on the way out; if that fails the pool's
+    session reset still clears them when the connection is returned.
+    An export never connects and gets None instead of a connection.
+    """
+    if _export_format:
+        yield None
+        return
+    conn = acquire_connection()
+    stage = current_stage()
+    try:
+        questions = count_statements(conn) if stage else 0
+        saved = apply_load_profile(conn)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                restore_session(conn, saved)
+            except mysql.connector.Error as e:
+                print(f"Could not restore session settings: {e}")
+            if stage:
+                # Less the second SHOW STATUS itself
+                stage.statements += count_statements(conn) - questions - 1
+    finally:
+        conn.close()
+
+def count_statements(conn):
+    """Return how many statements the session has sent to the server"""
+    cursor = conn.cursor()
+    cursor.execute("SHOW SESSION STATUS LIKE 'Questions'")
+    questions = int(cursor.fetchone()[1])
+    cursor.close()
+    return questions
+
+def get_max_allowed_packet(conn):
+    """Return the server's max_allowed_packet for a connection"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT @@max_allowed_packet")
+    max_allowed_packet = cursor.fetchone()[0]
+    cursor.close()
+    return int(max_allowed_packet)
+
+def estimate_sql_size(value):
+    """Estimate how many bytes a value takes once interpolated into a statement"""
+    if value is None:
+        return 4
+    if isinstance(value, str):
+        # Quotes and backslashes are escaped, which JSON columns are full of
+        return len(value.encode('utf-8')) + value.count('"') + value.count("'") + value.count('\\') + 3
+    if isinstance(value, (bytes, bytearray)):
+        return len(value) * 2 + 3
+    return 32
+
+class IdAllocator:
+    """Hand out primary keys for a table from the importer
+
+    Numbering starts after both the table's AUTO_INCREMENT counter and its
+    highest id, so the rows inserted with explicit ids never collide with
+    existing ones. finish() moves AUTO_INCREMENT past the last id handed out
+    so rows the application inserts later continue from there. Without a
+    connection (an export) numbering starts at 1, as in an empty table.
+    """
+
+    def __init__(self, conn, table):
+        self.conn = conn
+        self.table = table
+        if conn is None:
+            self.next_id = 1
+            return
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT AUTO_INCREMENT FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, (table,))
+        row = cursor.fetchone()
+        auto_increment = int(row[0]) if row and row[0] else 1
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+        max_id = int(cursor.fetchone()[0])
+        cursor.close()
+        self.next_id = max(auto_increment, max_id + 1)
+
+    def allocate(self):
+        """Return the next free id"""
+        row_id = self.next_id
+        self.next_id += 1
+        return row_id
+
+    def finish(self):
+        """Reset AUTO_INCREMENT to follow the ids handed out (implicitly commits)"""
+        if self.conn is None:
+            return
+        cursor = self.conn.cursor()
+        cursor.execute(f"ALTER TABLE {self.table} AUTO_INCREMENT = {int(self.next_id)}")
+        cursor.close()
+
+# Errors of a single row: the DataError and IntegrityError classes, and these
+# codes MySQL reports without an SQLSTATE that says so (incorrect and truncated
+# values, failed CHECK constraints)
+ROW_ERRNOS = {1265, 1366, 3819}
+
+def is_row_error(error):
+    """Return whether an error rejects the rows of a statement rather than its transaction"""
+    if isinstance(error, (mysql.connector.errors.DataError, mysql.connector.errors.IntegrityError)):
+        return True
+    return getattr(error, 'errno', None) in ROW_ERRNOS
+
+class BatchWriter:
+    """Buffer rows for one table and write them as multi-row INSERT statements
+
+    Rows are flushed every BATCH_SIZE rows, or earlier when the statement
+    would no longer fit in max_allowed_packet. A writer given a `mapping`
+    assigns primary keys itself through an IdAllocator: add() returns the
+    new row's id straight away, and once the row is written its key (the
+    MongoDB ObjectId) is mapped to that id.
+
+    A writer for a pivot table can name its `parent` writer: the parent is
+    flushed first and rows pointing at parent rows that failed to insert
+    (column `parent_column`) are dropped instead of being left orphaned.
+    Pivot writers hold PIVOT_BATCH_SIZE rows unless told otherwise.
+
+    A writer that shares its table with writers in other processes is
+    given a `first_id` to number its rows from instead, and leaves
+    AUTO_INCREMENT to whoever handed out the ids: resetting it takes a
+    metadata lock on the table that the other sessions would queue behind.
+
+    With upsert=True a key that is already mapped reuses its id and its row
+    is written with ON DUPLICATE KEY UPDATE, leaving `keep_columns`
+    untouched. Rows of new keys still go through a plain INSERT, so one
+    that collides with another row's unique key (a user's email, say) is
+    rejected as in a full run instead of overwriting that row. Writers
+    without a mapping, like the one storing the mappings, upsert every row.
+    The pivot rows of a parent updated in place are deleted before the
+    pivot writer inserts the new ones.
+
+    A batch the database rejects is written again in halves until the rows
+    that fail on their own are isolated. Those are sent to the dead-letter
+    files along with the `source` document add() was given, as is a row
+    too big for max_allowed_packet on its own, before it is buffered. Any
+    other error, such as a deadlock or a lost connection, ends the whole
+    transaction, rows flushed earlier included: the writer keeps it in
+    `error` and raises it again on every flush, and Checkpoint.track()
+    stops the migration so it can be resumed.
+    """
+
+    def __init__(self, conn, table, columns, name=None, mapping=None, parent=None, parent_column=0, batch_size=None,
+                 upsert=False, keep_columns=(), first_id=None):
+        self.conn = conn
+        self.cursor = conn.cursor() if conn is not None else None
+        self.table = table
+        self.name = name or table
+        self.mapping = mapping
+        self.parent = parent
+        self.parent_column = parent_column
+        self.allocator = IdAllocator(conn, table) if mapping is not None else None
+        self.shared = first_id is not None
+        if self.allocator:
+            if self.shared:
+                self.allocator.next_id = first_id
+            columns = ('id',) + tuple(columns)
+        self.columns = columns
+        self.batch_size = batch_size or (PIVOT_BATCH_SIZE if parent else BATCH_SIZE)
+        self.upsert = upsert
+        self.insert_prefix = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+        self.row_placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        self.update_suffix = ""
+        if upsert:
+            updates = [f"{column} = VALUES({column})" for column in columns if column != 'id' and column not in keep_columns]
+            self.update_suffix = " ON DUPLICATE KEY UPDATE " + ", ".join(updates)
+        self.max_bytes = None
+        if conn is not None:
+            self.max_bytes = get_max_allowed_packet(conn) - PACKET_HEADROOM - len(self.insert_prefix) - len(self.update_suffix)
+        # A row bigger than this can't be sent even on its own
+        self.max_row_bytes = self.max_bytes
+        self.rows = []
+        self.keys = []
+        self.sources = []
+        self.labels = []
+        # Whether each buffered row updates an existing one
+        self.updating = []
+        self.pending_bytes = 0
+        self.rows_written = 0
+        self.rejected_ids = set()
+        # Ids of existing rows updated in place, and how many of the parent's
+        # a pivot writer has already cleared
+        self.updated_ids = []
+        self.updates_cleared = 0
+        self.error = None
+
+    def add(self, row, key=None, label=None, source=None):
+        """Buffer a row, flushing first if it would overflow the current batch
+
+        `source` is the document the row comes from; only its _id and
+        `_offset` are kept. Returns the id assigned to the row, or None if
+        the table numbers its own rows.
+        """
+        row_id = None
+        updating = self.upsert and self.allocator is None
+        source = (source.get('_id'), source.get('_offset')) if source is not None else (key, None)
+        if self.allocator:
+            if self.exists(key):
+                updating = True
+                # Already mapped: the row is updated in place under its old id
+                row_id = self.mapping.get(key)
+                self.updated_ids.append(row_id)
+                key = None
+            else:
+                row_id = self.allocator.allocate()
+            row = (row_id,) + tuple(row)
+        size = sum(estimate_sql_size(value) for value in row) + len(row) * 2
+        if self.max_row_bytes is not None and size > self.max_row_bytes:
+            # The server would drop the connection rather than reject the row
+            error = mysql.connector.errors.DataError(msg=f"Row of about {size} bytes exceeds max_allowed_packet")
+            self._reject_row(label, row, source, error)
+            if self.allocator:
+                self.rejected_ids.add(row_id)
+            stage = current_stage()
+            if stage and self.table != ID_MAP_TABLE:
+                stage.failed[self.table] += 1
+            return row_id
+        if self.rows and (len(self.rows) >= self.batch_size or self.pending_bytes + size > self.max_bytes):
+            self.flush()
+        self.rows.append(row)
+        self.keys.append(key)
+        self.sources.append(source)
+        self.labels.append(label)
+        self.updating.append(updating)
+        self.pending_bytes += size
+        return row_id
+
+    def exists(self, key):
+        """Return whether add() would update an existing row for this key"""
+        return self.upsert and self.mapping is not None and key is not None and key in self.mapping
+
+    def flush(self):
+        """Write all buffered rows with a single INSERT"""
+        if self.error:
+            raise self.error
+        if self.parent:
+            self.parent.flush()
+            if self.parent.rejected_ids:
+                kept = [i for i, row in enumerate(self.rows) if row[self.parent_column] not in self.parent.rejected_ids]
+                self.rows = [self.rows[i] for i in kept]
+                self.keys = [self.keys[i] for i in kept]
+                self.sources = [self.sources[i] for i in kept]
+                self.labels = [self.labels[i] for i in kept]
+                self.updating = [self.updating[i] for i in kept]
+            if len(self.parent.updated_ids) > self.updates_cleared:
+                self._clear_updated_parents()
+        if not self.rows:
+            return
+        try:
+            written_flags = self._write_rows()
+        except Exception as e:
+            self.error = e
+            raise
+        written_before = self.rows_written
+        for row, key, written in zip(self.rows, self.keys, written_flags):
+            if not written:
+                if self.allocator:
+                    self.rejected_ids.add(row[0])
+                continue
+            self.rows_written += 1
+            if self.mapping is not None and key is not None:
+                self.mapping[key] = row[0]
+        stage = current_stage()
+        if stage and self.table != ID_MAP_TABLE:
+            stage.rows[self.table] += self.rows_written - written_before
+            stage.failed[self.table] += len(self.rows) - (self.rows_written - written_before)
+        self.rows = []
+        self.keys = []
+        self.sources = []
+        self.labels = []
+        self.updating = []
+        self.pending_bytes = 0
+
+    def _clear_updated_parents(self):
+        """Delete the pivot rows of parent rows updated since the last flush"""
+        parent_ids = [
+            parent_id for parent_id in self.parent.updated_ids[self.updates_cleared:]
+            if parent_id not in self.parent.rejected_ids
+        ]
+        self.updates_cleared = len(self.parent.updated_ids)
+        column = self.columns[self.parent_column]
+        for start in range(0, len(parent_ids), self.batch_size):
+            chunk = parent_ids[start:start + self.batch_size]
+            self.cursor.execute(
+                f"DELETE FROM {self.table} WHERE {column} IN ({', '.join(['%s'] * len(chunk))})", chunk
+            )
+
+    def _insert(self, rows, update=False):
+        """Write rows in one statement, raising if any of them is rejected"""
+        sql = self.insert_prefix + ", ".join([self.row_placeholder] * len(rows)) + (self.update_suffix if update else "")
+        self.cursor.execute(sql, [value for row in rows for value in row])
+
+    def _write_rows(self):
+        """Insert the buffered rows and return whether each one was written
+
+        Rows updating existing ones are moved ahead of the new rows, so each
+        kind goes out in statements of its own.
+        """
+        updates = sum(self.updating)
+        if 0 < updates < len(self.rows):
+            order = sorted(range(len(self.rows)), key=lambda i: not self.updating[i])
+            self.rows = [self.rows[i] for i in order]
+            self.keys = [self.keys[i] for i in order]
+            self.sources = [self.sources[i] for i in order]
+            self.labels = [self.labels[i] for i in order]
+            self.updating = [self.updating[i] for i in order]
+        written = self._write_range(0, updates) if updates else []
+        if updates < len(self.rows):
+            written += self._write_range(updates, len(self.rows))
+        return written
+
+    def _write_range(self, start, end, rejected=False):
+        """Write rows[start:end], splitting it in halves while it is rejected
+
+        The failed statement was rolled back as a whole, so one bad document
+        costs a statement or two per halving instead of a statement for
+        every row in the batch. A `rejected` range (the second half of a
+        rejected range whose first half went in) is split without trying it.
+        Errors that aren't row errors are raised.
+        """
+        if not rejected or end - start == 1:
+            try:
+                self._insert(self.rows[start:end], self.updating[start])
+                return [True] * (end - start)
+            except Exception as e:
+                if not is_row_error(e):
+                    raise
+                if end - start == 1:
+                    self._reject(start, e)
+                    return [False]
+        middle = (start + end) // 2
+        first = self._write_range(start, middle)
+        return first + self._write_range(middle, end, rejected=all(first))
+
+    def _reject(self, index, error):
+        self._reject_row(self.labels[index], self.rows[index], self.sources[index], error)
+
+    def _reject_row(self, label, row, source, error):
+        print(f"Error migrating {self.name} {label or 'unknown'}: {error}")
+        if self.table != ID_MAP_TABLE:
+            document_id, offset = source
+            write_dead_letter(self.parent.table if self.parent else self.table, document_id, offset,
+                              label, row, error)
+
+    def close(self):
+        """Flush remaining rows, reset AUTO_INCREMENT and release the cursor"""
+        self.flush()
+        if self.allocator and not self.shared:
+            self.allocator.finish()
+        if self.cursor:
+            self.cursor.close()
+
+TSV_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+
+def to_tsv_field(value):
+    """Render a value in LOAD DATA's default escaping (NULL is \\N)"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return str(value).translate(TSV_ESCAPES)
+
+class InfileWriter(BatchWriter):
+    """BatchWriter that loads each batch with LOAD DATA LOCAL INFILE
+
+    Rows are written to a temporary UTF-8 TSV file which is then loaded in
+    one statement. LOCAL loads turn row errors into warnings: a row with a
+    duplicate key is skipped, and a value that doesn't fit is truncated or
+    adjusted and loaded anyway. So a load that raises any warning is rolled
+    back to a savepoint and treated as rejected; halving it then finds the
+    rows that caused them, with the first warning as their error.
+    """
+
+    def __init__(self, conn, table, columns, batch_size=None, **kwargs):
+        super().__init__(conn, table, columns, batch_size=batch_size or INFILE_BATCH_SIZE, **kwargs)
+        self.max_bytes = INFILE_MAX_BYTES
+        fd, self.path = tempfile.mkstemp(prefix=f"{table}-", suffix='.tsv')
+        os.close(fd)
+        self.load_sql = f"""
+            LOAD DATA LOCAL INFILE %s INTO TABLE {table}
+            CHARACTER SET utf8mb4
+            FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+            LINES TERMINATED BY '\\n'
+            ({', '.join(self.columns)})
+        """
+
+    def _insert(self, rows, update=False):
+        with open(self.path, 'w', encoding='utf-8', newline='') as f:
+            for row in rows:
+                f.write('\t'.join([to_tsv_field(value) for value in row]))
+                f.write('\n')
+
+        self.cursor.execute("SAVEPOINT infile_batch")
+        try:
+            self.cursor.execute(self.load_sql, (self.path,))
+            loaded = self.cursor.rowcount
+            if loaded != len(rows) or self.cursor.warning_count:
+                self.cursor.execute("SHOW WARNINGS LIMIT 1")
+                warning = self.cursor.fetchone()
+                if warning:
+                    raise mysql.connector.errors.DataError(msg=warning[2], errno=warning[1])
+                raise mysql.connector.errors.DataError(msg=f"LOAD DATA loaded {loaded} of {len(rows)} rows")
+        except Exception:
+            self.cursor.execute("ROLLBACK TO SAVEPOINT infile_batch")
+            raise
+        self.cursor.execute("RELEASE SAVEPOINT infile_batch")
+
+    def close(self):
+        """Flush remaining rows and remove the temporary file"""
+        try:
+            super().close()
+        finally:
+            os.unlink(self.path)
+
+def to_csv_field(value):
+    """Render a value for a CSV export, NULL as \\N like LOAD DATA expects"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return value
+
+def parquet_array(values, type=None):
+    """Return an Arrow array of the values, of `type` if they fit it"""
+    if type is not None and not pyarrow.types.is_null(type):
+        try:
+            return pyarrow.array(values, type=type)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            pass
+    try:
+        return pyarrow.array(values)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        # Mixed types in one column, such as phone numbers stored as
+        # both numbers and strings, are exported as strings
+        return pyarrow.array([None if value is None else str(value) for value in values])
+
+def widen_type(current, new):
+    """Return the type a column of both types is cast to"""
+    if pyarrow.types.is_null(current):
+        return new
+    if pyarrow.types.is_null(new) or new == current:
+        return current
+    if all(pyarrow.types.is_integer(type) or pyarrow.types.is_floating(type) for type in (current, new)):
+        return pyarrow.float64()
+    return pyarrow.string()
+
+def write_parquet(path, columns, rows, schema=None):
+    """Write rows to a Parquet file and return its schema
+
+    Columns keep their type in `schema`, that of the table's earlier parts,
+    where the values fit it; otherwise pyarrow infers one and the column is
+    widened to hold both.
+    """
+    arrays = []
+    for index in range(len(columns)):
+        current = schema.field(index).type if schema is not None else None
+        array = parquet_array([row[index] for row in rows], current)
+        if current is not None and array.type != current:
+            array = array.cast(widen_type(current, array.type))
+        arrays.append(array)
+    table = pyarrow.table(arrays, names=list(columns))
+    pyarrow.parquet.write_table(table, path)
+    return table.schema
+
+class ExportWriter(BatchWriter):
+    """BatchWriter that writes each batch to a file instead of the database
+
+    Every flush writes one part file to the table's directory under
+    EXPORT_PATH, so the parts can be loaded in parallel later. Ids are
+    assigned as for empty tables and foreign keys come from the id mappings
+    as usual. Parquet parts share one schema, so the directory reads back
+    as a dataset: when a part needs a column widened (a type for one that
+    was all NULL so far, say), the earlier parts are rewritten to match.
+    """
+
+    def __init__(self, table, columns, batch_size=None, **kwargs):
+        super().__init__(None, table, columns, batch_size=batch_size or EXPORT_BATCH_SIZE, **kwargs)
+        self.max_bytes = EXPORT_MAX_BYTES
+        self.directory = EXPORT_PATH / table
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory.mkdir(parents=True)
+        self.parts = 0
+        self.schema = None
+
+    def _write_rows(self):
+        path = self.directory / f"part-{self.parts:05d}.{_export_format}"
+        self.parts += 1
+        if _export_format == 'parquet':
+            schema = write_parquet(path, self.columns, self.rows, self.schema)
+            if self.schema is not None and schema != self.schema:
+                for part in self.directory.glob('part-*.parquet'):
+                    if part != path:
+                        pyarrow.parquet.write_table(pyarrow.parquet.read_table(part).cast(schema), part)
+            self.schema = schema
+        else:
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(self.columns)
+                writer.writerows([to_csv_field(value) for value in row] for row in self.rows)
+        return [True] * len(self.rows)
+
+SQL_ESCAPES = str.maketrans({
+    '\\': '\\\\', "'": "\\'", '\0': '\\0', '\n': '\\n', '\r': '\\r', '\x1a': '\\Z'
+})
+
+def to_sql_literal(value):
+    """Render a value as a MySQL literal for the SQL dump"""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, (bytes, bytearray)):
+        return f"X'{value.hex()}'"
+    # Strings, dates and decimals
+    return "'" + str(value).translate(SQL_ESCAPES) + "'"
+
+class SqlDump:
+    """Gzipped SQL script that replays a whole migration with the mysql client
+
+    Like mysqldump output it turns off foreign key and unique checks for
+    the session and empties the migrated tables first. The id mappings and
+    watermarks of earlier live runs are emptied too, as a full run does:
+    they point at rows the dump replaces. Statements from the migrations
+    running in parallel are appended under a lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.statements = 0
+        self.file = gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+        self.file.write(
+            f"-- MongoDB to MySQL migration of {MONGO_BACKUP_PATH}\n"
+            f"-- Generated {datetime.now().isoformat(timespec='seconds')}\n\n"
+            "SET NAMES utf8mb4;\n"
+            "SET @OLD_FOREIGN_KEY_CHECKS=@@FOREIGN_KEY_CHECKS, FOREIGN_KEY_CHECKS=0;\n"
+            "SET @OLD_UNIQUE_CHECKS=@@UNIQUE_CHECKS, UNIQUE_CHECKS=0;\n"
+            "SET @OLD_AUTOCOMMIT=@@AUTOCOMMIT, AUTOCOMMIT=0;\n\n"
+        )
+        for statement in SYNC_TABLE_DDL:
+            self.file.write(statement + ";\n")
+        for table in MIGRATED_TABLES + [ID_MAP_TABLE, WATERMARK_TABLE]:
+            self.file.write(f"TRUNCATE TABLE `{table}`;\n")
+        self.file.write("\n")
+
+    def write(self, statement):
+        with self.lock:
+            self.file.write(statement)
+            self.file.write(";\n")
+            self.statements += 1
+            if self.statements % DUMP_COMMIT_EVERY == 0:
+                self.file.write("COMMIT;\n")
+
+    def close(self):
+        self.file.write(
+            "COMMIT;\n\n"
+            "SET AUTOCOMMIT=@OLD_AUTOCOMMIT;\n"
+            "SET UNIQUE_CHECKS=@OLD_UNIQUE_CHECKS;\n"
+            "SET FOREIGN_KEY_CHECKS=@OLD_FOREIGN_KEY_CHECKS;\n"
+        )
+        self.file.close()
+
+class SqlDumpWriter(BatchWriter):
+    """BatchWriter that appends each batch to the SQL dump as one INSERT"""
+
+    def __init__(self, table, columns, batch_size=None, **kwargs):
+        super().__init__(None, table, columns, batch_size=batch_size or DUMP_BATCH_SIZE, **kwargs)
+        # Identifiers are quoted since some columns (settings.key) are reserved words
+        self.insert_prefix = f"INSERT INTO `{table}` ({', '.join(f'`{column}`' for column in self.columns)}) VALUES "
+        self.max_bytes = DUMP_MAX_BYTES - len(self.insert_prefix)
+
+    def _write_rows(self):
+        values = ",".join("(" + ",".join([to_sql_literal(value) for value in row]) + ")" for row in self.rows)
+        _sql_dump.write(self.insert_prefix + values)
+        return [True] * len(self.rows)
+
+_dead_letter_lock = threading.Lock()
+_dead_letter_documents = set()
+
+def reset_dead_letters():
+    """Remove the dead letters of earlier runs"""
+    shutil.rmtree(DEAD_LETTER_PATH, ignore_errors=True)
+    with _dead_letter_lock:
+        _dead_letter_documents.clear()
+
+def write_dead_letter(table, document_id, offset, label, row, error):
+    """Log a rejected row and copy the document it came from to DEAD_LETTER_PATH
+
+    The document is copied from `offset` in its dump file, where the reader
+    found it, so nothing has to be looked up. Each document is copied once
+    however many of its rows fail.
+    """
+    filename = SOURCE_FILES.get(table)
+    entry = {
+        'collection': Path(filename).stem if filename else None,
+        'table': table,
+        '_id': str(document_id) if document_id is not None else None,
+        'label': label,
+        'error': str(error),
+        'row': row,
+    }
+    with _dead_letter_lock:
+        DEAD_LETTER_PATH.mkdir(parents=True, exist_ok=True)
+        with open(DEAD_LETTER_PATH / DEAD_LETTER_LOG, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+        if filename is None or offset is None or (filename, offset) in _dead_letter_documents:
+            return
+        with open(os.path.join(MONGO_BACKUP_PATH, filename), 'rb') as f:
+            f.seek(offset)
+            header = f.read(4)
+            document = header + f.read(int.from_bytes(header, 'little') - 4)
+        with open(DEAD_LETTER_PATH / filename, 'ab') as f:
+            f.write(document)
+        _dead_letter_documents.add((filename, offset))
+
+# Set by migrate_all for an --incremental run, and to 'csv', 'parquet' or
+# 'sql' for an --export, which writes to _sql_dump in the last case. A
+# --replay run is incremental but migrates every document it is given.
+_incremental = False
+_replay = False
+_export_format = None
+_sql_dump = None
+
+def open_writer(conn, table, columns, **kwargs):
+    """Return the writer for a table according to LOAD_MODE
+
+    In an incremental run, writers with an id mapping upsert their rows;
+    those always go through INSERT, which LOAD DATA can't do without
+    deleting the old rows first. An export writes every table to files.
+    """
+    if _export_format == 'sql':
+        return SqlDumpWriter(table, columns, **kwargs)
+    if _export_format:
+        return ExportWriter(table, columns, **kwargs)
+    if _incremental and kwargs.get('mapping') is not None:
+        kwargs['upsert'] = True
+    if LOAD_MODE == 'infile' and table in INFILE_TABLES and not kwargs.get('upsert'):
+        return InfileWriter(conn, table, columns, **kwargs)
+    return BatchWriter(conn, table, columns, **kwargs)
+
+_checkpoint_lock = threading.Lock()
+
+def load_checkpoint_state():
+    """Return the saved progress of every migration, keyed by migration name"""
+    path = CHECKPOINT_PATH / 'state.json'
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+def save_checkpoint_entry(name, entry):
+    """Atomically replace one migration's entry in the checkpoint state"""
+    with _checkpoint_lock:
+        CHECKPOINT_PATH.mkdir(parents=True, exist_ok=True)
+        state = load_checkpoint_state()
+        state[name] = entry
+        tmp_path = CHECKPOINT_PATH / 'state.json.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, CHECKPOINT_PATH / 'state.json')
+
+def reset_checkpoints():
+    """Forget all saved progress before a fresh run"""
+    shutil.rmtree(CHECKPOINT_PATH, ignore_errors=True)
+    CHECKPOINT_PATH.mkdir(parents=True)
+
+def load_checkpoint_mappings(table, size):
+    """Read a table's saved id mappings, dropping anything past `size` bytes"""
+    path = CHECKPOINT_PATH / f"{table}.map"
+    if not path.exists():
+        return
+    with open(path, 'r+b') as f:
+        f.truncate(size)
+        f.seek(0)
+        while True:
+            chunk = f.read(MAPPING_RECORD.size * 65536)
+            if not chunk:
+                break
+            id_mappings[table].restore(MAPPING_RECORD.iter_unpack(chunk))
+
+def restore_migration(name):
+    """Load the mappings of a migration that finished in an earlier run"""
+    entry = load_checkpoint_state()[name]
+    for table, size in entry['map_sizes'].items():
+        load_checkpoint_mappings(table, size)
+    print(f"Skipping {name}: already migrated")
+
+def document_timestamp(doc):
+    """Return when a document was last updated, if it records it"""
+    stamp = doc.get('updatedAt') or doc.get('updated_at')
+    return stamp if isinstance(stamp, datetime) else None
+
+def raise_writer_error(writers):
+    """Raise the error that broke any of the writers"""
+    for writer in writers:
+        if writer.error:
+            raise writer.error
+
+class Checkpoint:
+    """Commit a migration in steps and record how far it got
+
+    Each commit saves the number of documents consumed, the highest id in
+    every table the migration writes and the length of its mapping logs.
+    Resuming deletes rows above those ids (and pivot rows pointing at
+    them), which are the ones written after the last checkpoint, reloads
+    the mappings and seeks past the documents that were already committed.
+
+    New id mappings are also stored in ID_MAP_TABLE with every commit, and
+    the newest updatedAt seen is stored in WATERMARK_TABLE once the
+    migration is done. An incremental run only passes on documents updated
+    after that watermark, or not yet mapped if they have no updatedAt; a
+    replay passes on all of them and leaves the watermark where it was.
+
+    `mappings` names further id_mappings the migration fills, which are
+    saved like those of its tables.
+
+    An export (conn is None) always starts over, so nothing is saved and
+    commits only drop the pending mappings.
+    """
+
+    def __init__(self, name, conn, tables, links=None, mappings=()):
+        self.name = name
+        self.conn = conn
+        self.tables = tables
+        self.links = links or {}
+        self.mapped = [table for table in list(tables) + list(mappings) if table in id_mappings]
+        stage = current_stage()
+        if stage and tables:
+            stage.table = tables[0]
+        self.incremental = _incremental and not _replay and conn is not None
+        if conn is None:
+            self.since = self.latest = None
+            self.documents = self.committed = 0
+            return
+        self.cursor = conn.cursor()
+        watermark = self._load_watermark() if _incremental else None
+        self.since = None if _replay else watermark
+        self.id_writer = BatchWriter(conn, ID_MAP_TABLE, ('table_name', 'mongo_id', 'mysql_id'),
+                                     name='id mapping', upsert=True)
+        entry = load_checkpoint_state().get(name)
+        if entry:
+            self.documents = entry['documents']
+            self.last_ids = entry['last_ids']
+            self.map_sizes = entry['map_sizes']
+            self.latest = datetime.fromisoformat(entry['watermark']) if entry.get('watermark') else watermark
+            self._discard_uncommitted()
+            print(f"Resuming {name} after {self.documents} documents")
+        else:
+            self.documents = 0
+            self.last_ids = self._max_ids()
+            self.map_sizes = {table: 0 for table in self.mapped}
+            self.latest = watermark
+            self._save('running')
+        self.committed = self.documents
+
+    def _load_watermark(self):
+        self.cursor.execute(f"SELECT updated_at FROM {WATERMARK_TABLE} WHERE collection = %s", (self.name,))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def _max_ids(self):
+        last_ids = {}
+        for table in self.tables:
+            self.cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+            last_ids[table] = int(self.cursor.fetchone()[0])
+        return last_ids
+
+    def _discard_uncommitted(self):
+        for table, last_id in self.last_ids.items():
+            self.cursor.execute(f"DELETE FROM {table} WHERE id > %s", (last_id,))
+        for table, (column, parent_table) in self.links.items():
+            self.cursor.execute(f"DELETE FROM {table} WHERE {column} > %s", (self.last_ids[parent_table],))
+        self.conn.commit()
+        for table, size in self.map_sizes.items():
+            load_checkpoint_mappings(table, size)
+
+    def _save(self, status):
+        save_checkpoint_entry(self.name, {
+            'status': status,
+            'documents': self.documents,
+            'last_ids': self.last_ids,
+            'map_sizes': self.map_sizes,
+            'watermark': self.latest.isoformat() if self.latest else None,
+        })
+
+    def changed(self, documents):
+        """Yield the documents this run migrates, noting the newest updatedAt
+
+        Outside an incremental run that is every document. Otherwise it is
+        those updated after the watermark (all dated ones if there is none
+        yet), plus undated ones whose _id has no mapping yet. Collections
+        without updatedAt, such as price histories, never get a watermark
+        and rely on the mapping alone.
+        """
+        mapping = id_mappings.get(self.tables[0]) if self.tables else None
+        for doc in documents:
+            stamp = document_timestamp(doc)
+            if stamp is not None and (self.latest is None or stamp > self.latest):
+                self.latest = stamp
+            if self.incremental:
+                if stamp is not None:
+                    if self.since is not None and stamp <= self.since:
+                        continue
+                elif mapping is None or doc.get('_id') in mapping:
+                    continue
+            yield doc
+
+    def track(self, documents, *writers):
+        """Yield the documents not yet committed, committing every CHECKPOINT_EVERY
+
+        `documents` must start after the ones already committed; readers
+        seek there with skip=checkpoint.documents. A writer's database
+        error is raised here, past the migration's handler for the document.
+        """
+        return self.changed(self._uncommitted(documents, writers))
+
+    def _uncommitted(self, documents, writers):
+        for doc in documents:
+            if self.documents - self.committed >= CHECKPOINT_EVERY:
+                self.commit(*writers)
+            self.documents += 1
+            yield doc
+            raise_writer_error(writers)
+
+    def commit(self, *writers, status='running'):
+        """Flush the writers in order, commit, then persist the progress"""
+        if self.conn is None:
+            for table in self.mapped:
+                id_mappings[table].pending.clear()
+            self.committed = self.documents
+            return
+        for writer in writers:
+            writer.flush()
+        for table in self.map_sizes:
+            for binary, mysql_id in id_mappings[table].pending:
+                self.id_writer.add((table, binary, mysql_id), label=binary.hex())
+        self.id_writer.flush()
+        if status == 'done' and self.latest is not None:
+            self.cursor.execute(f"""
+                INSERT INTO {WATERMARK_TABLE} (collection, updated_at) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE updated_at = VALUES(updated_at)
+            """, (self.name, self.latest))
+        self.conn.commit()
+        self.last_ids = self._max_ids()
+        for table in self.map_sizes:
+            mapping = id_mappings[table]
+            if not mapping.pending:
+                continue
+            with open(CHECKPOINT_PATH / f"{table}.map", 'ab') as f:
+                f.write(b''.join(MAPPING_RECORD.pack(binary, mysql_id) for binary, mysql_id in mapping.pending))
+                f.flush()
+                os.fsync(f.fileno())
+                self.map_sizes[table] = f.tell()
+            mapping.pending.clear()
+        self._save(status)
+        self.committed = self.documents
+
+    def complete(self, *writers):
+        """Commit the remaining rows and mark the migration as finished"""
+        self.commit(*writers, status='done')
+        if self.conn is not None:
+            self.id_writer.close()
+            self.cursor.close()
+
+class SlugAllocator:
+    """Hand out unique slugs, suffixing repeats with -1, -2, ..."""
+    
+    def __init__(self, slugs=()):
+        self.taken = set(slugs)
+        # Next suffix worth trying per base slug; every lower one is taken
+        self.next_suffix = {}
+    
+    @classmethod
+    def from_table(cls, conn, table):
+        """Seed the allocator with the slugs already stored in a table"""
+        if conn is None:
+            return cls()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT slug FROM {table}")
+        allocator = cls(row[0] for row in cursor.fetchall())
+        cursor.close()
+        return allocator
+    
+    def add(self, slug):
+        self.taken.add(slug)
+    
+    def allocate(self, slug):
+        if slug not in self.taken:
+            self.taken.add(slug)
+            return slug
+        
+        counter = self.next_suffix.get(slug, 1)
+        while f"{slug}-{counter}" in self.taken:
+            counter += 1
+        unique_slug = f"{slug}-{counter}"
+        self.taken.add(unique_slug)
+        self.next_suffix[slug] = counter + 1
+        return unique_slug
+
+class BrandIndex:
+    """Brand ids by name and the slugs in use, loaded once and shared"""
+    
+    def __init__(self, conn):
+        self.ids = {}
+        self.slugs = SlugAllocator()
+        if conn is None:
+            return
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, slug FROM brands ORDER BY id")
+        for brand_id, name, slug in cursor.fetchall():
+            self.ids.setdefault(name, brand_id)
+            self.slugs.add(slug)
+        cursor.close()
+    
+    def get(self, name):
+        return self.ids.get(name) if name else None
+    
+    def add(self, name, brand_id):
+        self.ids.setdefault(name, brand_id)
+
+_brand_index = None
+_brand_index_lock = threading.Lock()
+
+def get_brand_index(conn):
+    """Load the brand index from the database on first use"""
+    global _brand_index
+    with _brand_index_lock:
+        if _brand_index is None:
+            _brand_index = BrandIndex(conn)
+        return _brand_index
+
+def reset_brand_index():
+    """Forget the brand index so it is reloaded from the database"""
+    global _brand_index
+    with _brand_index_lock:
+        _brand_index = None
+
+def ensure_sync_tables():
+    """Create the tables that keep id mappings and watermarks between runs"""
+    with load_session() as conn:
+        cursor = conn.cursor()
+        for statement in SYNC_TABLE_DDL:
+            cursor.execute(statement)
+        cursor.close()
+
+def read_saved_mapping(cursor, table, mapping):
+    """Add the id mappings ID_MAP_TABLE holds for a table to `mapping`"""
+    cursor.execute(f"SELECT mongo_id, mysql_id FROM {ID_MAP_TABLE} WHERE table_name = %s", (table,))
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        mapping.restore((bytes(binary), mysql_id) for binary, mysql_id in rows)
+
+def load_saved_mappings():
+    """Load the id mappings stored by earlier runs"""
+    with load_session() as conn:
+        cursor = conn.cursor()
+        for table, mapping in id_mappings.items():
+            read_saved_mapping(cursor, table, mapping)
+        cursor.close()
+
+def truncate_all_tables():
+    """Truncate all tables to start fresh"""
+    with load_session() as conn:
+        # Foreign key checks are already disabled by the load session
+        cursor = conn.cursor()
+        
+        for table in MIGRATED_TABLES + [ID_MAP_TABLE, WATERMARK_TABLE]:
+            try:
+                cursor.execute(f"TRUNCATE TABLE {table}")
+                print(f"Truncated table: {table}")
+            except Exception as e:
+                print(f"Error truncating {table}: {e}")
+        
+        conn.commit()
+        cursor.close()
+    reset_brand_index()
+
+def settings_map_from(doc):
+    """Map the old settings document to the new key-value structure"""
+    return {
+        'site_logo': doc.get('logo', '/logo.png'),
+        'meta_title': doc.get('metaTitle', 'KampanyaRadar'),
+        'meta_description': doc.get('metaDescription', 'Türkiye\'nin en güncel kampanya platformu'),
+        'meta_keywords': doc.get('metaKeywords', 'kampanya, indirim, fırsat'),
+        'meta_separator': doc.get('metaSeperate', '|'),
+        'head_after_code': doc.get('headAfterCode', ''),
+        'body_after_code': doc.get('bodyAfterCode', ''),
+    }
+
+def quote_identifier(name):
+    return '`' + name.replace('`', '``') + '`'
+
+def describe_secondary_indexes(cursor, table):
+    """Return ADD clauses for a table's non-unique indexes and its foreign keys
+
+    Both are dicts keyed by index or constraint name. Unique indexes are
+    left out: they stay in place during the load so duplicates are still
+    rejected row by row.
+    """
+    cursor.execute("""
+        SELECT INDEX_NAME, INDEX_TYPE, COLUMN_NAME, EXPRESSION, SUB_PART, COLLATION
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND NON_UNIQUE = 1
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """, (table,))
+    parts = {}
+    types = {}
+    for name, index_type, column, expression, sub_part, collation in cursor.fetchall():
+        part = quote_identifier(column) if column else f"({expression})"
+        if sub_part:
+            part += f"({sub_part})"
+        if collation == 'D':
+            part += " DESC"
+        parts.setdefault(name, []).append(part)
+        types[name] = index_type
+    indexes = {
+        name: f"ADD {types[name] + ' ' if types[name] in ('FULLTEXT', 'SPATIAL') else ''}INDEX "
+              f"{quote_identifier(name)} ({', '.join(columns)})"
+        for name, columns in parts.items()
+    }
+    
+    cursor.execute("""
+        SELECT k.CONSTRAINT_NAME, k.COLUMN_NAME, k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME,
+               r.DELETE_RULE, r.UPDATE_RULE
+        FROM information_schema.KEY_COLUMN_USAGE k
+        JOIN information_schema.REFERENTIAL_CONSTRAINTS r
+            ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+        WHERE k.TABLE_SCHEMA = DATABASE() AND k.TABLE_NAME = %s AND k.REFERENCED_TABLE_NAME IS NOT NULL
+        ORDER BY k.CONSTRAINT_NAME, k.ORDINAL_POSITION
+    """, (table,))
+    constraints = {}
+    for name, column, referenced_table, referenced_column, delete_rule, update_rule in cursor.fetchall():
+        constraint = constraints.setdefault(name, {
+            'columns': [], 'table': referenced_table, 'referenced': [], 'rules': (delete_rule, update_rule)
+        })
+        constraint['columns'].append(quote_identifier(column))
+        constraint['referenced'].append(quote_identifier(referenced_column))
+    foreign_keys = {
+        name: f"ADD CONSTRAINT {quote_identifier(name)} FOREIGN KEY ({', '.join(constraint['columns'])}) "
+              f"REFERENCES {quote_identifier(constraint['table'])} ({', '.join(constraint['referenced'])}) "
+              f"ON DELETE {constraint['rules'][0]} ON UPDATE {constraint['rules'][1]}"
+        for name, constraint in constraints.items()
+    }
+    return indexes, foreign_keys
+
+def load_saved_indexes():
+    """Return the index definitions saved before they were dropped, by table"""
+    if not INDEX_DDL_PATH.exists():
+        return {}
+    return json.loads(INDEX_DDL_PATH.read_text())
+
+def save_indexes(saved):
+    tmp_path = INDEX_DDL_PATH.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(saved, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, INDEX_DDL_PATH)
+
+def drop_secondary_indexes():
+    """Drop the secondary indexes and foreign keys of INDEX_REBUILD_TABLES
+
+    The definitions are saved to INDEX_DDL_PATH before anything is dropped.
+    Tables an interrupted run already saved keep their saved definitions,
+    since their indexes may be gone by now.
+    """
+    saved = load_saved_indexes()
+    with load_session() as conn:
+        cursor = conn.cursor()
+        for table in INDEX_REBUILD_TABLES:
+            if table not in saved:
+                indexes, foreign_keys = describe_secondary_indexes(cursor, table)
+                saved[table] = {'indexes': indexes, 'foreign_keys': foreign_keys}
+        save_indexes(saved)
+        
+        for table in INDEX_REBUILD_TABLES:
+            indexes, foreign_keys = describe_secondary_indexes(cursor, table)
+            # Foreign keys first, as they may need the indexes dropped after them
+            for drop, kind, names in (('FOREIGN KEY', 'foreign_keys', foreign_keys), ('INDEX', 'indexes', indexes)):
+                drops = [f"DROP {drop} {quote_identifier(name)}" for name in names if name in saved[table][kind]]
+                if not drops:
+                    continue
+                try:
+                    cursor.execute(f"ALTER TABLE {table} {', '.join(drops)}")
+                    print(f"Dropped {len(drops)} {kind.replace('_', ' ')} of {table}")
+                except mysql.connector.Error as e:
+                    print(f"Could not drop the {kind.replace('_', ' ')} of {table}: {e}")
+        cursor.close()
+
+def rebuild_table_indexes(table, definitions):
+    """Add the saved indexes and foreign keys a table is missing"""
+    started = time.monotonic()
+    with load_session() as conn:
+        cursor = conn.cursor()
+        indexes, foreign_keys = describe_secondary_indexes(cursor, table)
+        # Foreign keys are added without checking the rows, as foreign key
+        # checks are off in the load session
+        for kind, existing in (('indexes', indexes), ('foreign_keys', foreign_keys)):
+            missing = [clause for name, clause in definitions[kind].items() if name not in existing]
+            if not missing:
+                continue
+            try:
+                cursor.execute(f"ALTER TABLE {table} {', '.join(missing)}")
+            except mysql.connector.Error as e:
+                print(f"Could not rebuild the {kind.replace('_', ' ')} of {table}: {e}")
+                return False
+        cursor.close()
+    print(f"Rebuilt secondary indexes of {table} in {time.monotonic() - started:.1f}s")
+    return True
+
+def rebuild_secondary_indexes():
+    """Recreate the indexes saved in INDEX_DDL_PATH, tables in parallel
+
+    The saved definitions are only removed once every table has all of
+    them back.
+    """
+    saved = load_saved_indexes()
+    if not saved:
+        return
+    print("Rebuilding secondary indexes...")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        rebuilt = list(pool.map(rebuild_table_indexes, saved, saved.values()))
+    if all(rebuilt):
+        INDEX_DDL_PATH.unlink()
+    else:
+        print(f"Index definitions kept in {INDEX_DDL_PATH}; they are restored on the next run")
 
 def migrate_settings():
     """Migrate settings collection to key-value structure"""
@@ -108,40 +1985,42 @@ def migrate_settings():
         return
     
     documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    if documents:  # Should only have one settings document
-        doc = documents[0]
+    with load_session() as conn:
+        checkpoint = Checkpoint('settings', conn, [])
         
-        # Map old settings to new key-value structure
-        settings_map = {
-            'site_logo': doc.get('logo', '/logo.png'),
-            'meta_title': doc.get('metaTitle', 'KampanyaRadar'),
-            'meta_description': doc.get('metaDescription', 'Türkiye\'nin en güncel kampanya platformu'),
-            'meta_keywords': doc.get('metaKeywords', 'kampanya, indirim, fırsat'),
-            'meta_separator': doc.get('metaSeperate', '|'),
-            'head_after_code': doc.get('headAfterCode', ''),
-            'body_after_code': doc.get('bodyAfterCode', ''),
-        }
+        doc = next(documents, None)  # Should only have one settings document
+        documents.close()
+        if doc and _export_format == 'sql':
+            # Like a live run the dump only updates the settings that exist
+            for key, value in settings_map_from(doc).items():
+                _sql_dump.write(
+                    f"UPDATE `settings` SET `value` = {to_sql_literal(value)}, "
+                    f"`updated_at` = {to_sql_literal(datetime.now())} WHERE `key` = {to_sql_literal(key)}"
+                )
+        elif doc and conn is None:
+            # An export has no default rows to update and writes every setting
+            writer = open_writer(conn, 'settings', ('key', 'value', 'updated_at'), name='setting')
+            for key, value in settings_map_from(doc).items():
+                writer.add((key, value, datetime.now()), label=key)
+            writer.close()
+        elif doc:
+            cursor = conn.cursor()
+            for key, value in settings_map_from(doc).items():
+                try:
+                    # Update existing or skip if already exists
+                    cursor.execute("""
+                        UPDATE settings 
+                        SET value = %s, updated_at = %s
+                        WHERE `key` = %s
+                    """, (value, datetime.now(), key))
+                    
+                    if cursor.rowcount == 0:
+                        print(f"Setting {key} not found in database, skipping...")
+                except Exception as e:
+                    print(f"Error migrating setting {key}: {e}")
+            cursor.close()
         
-        for key, value in settings_map.items():
-            try:
-                # Update existing or skip if already exists
-                cursor.execute("""
-                    UPDATE settings 
-                    SET value = %s, updated_at = %s
-                    WHERE `key` = %s
-                """, (value, datetime.now(), key))
-                
-                if cursor.rowcount == 0:
-                    print(f"Setting {key} not found in database, skipping...")
-            except Exception as e:
-                print(f"Error migrating setting {key}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+        checkpoint.complete()
     print("Settings migration completed")
 
 def migrate_users():
@@ -153,47 +2032,43 @@ def migrate_users():
         print("Users file not found")
         return
     
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    for doc in documents:
-        try:
-            # Generate a simple password hash (in production, this should be bcrypt)
-            password = doc.get('password', 'password123')
-            if not password.startswith('$2'):  # Not already hashed
-                password = f"$2y$12${hashlib.sha256(password.encode()).hexdigest()[:22]}"
-            
-            cursor.execute("""
-                INSERT INTO users (first_name, last_name, email, phone, password, role, 
-                                 is_banned, is_active, last_login, birth_date, gender, 
-                                 created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                doc.get('firstName', ''),
-                doc.get('lastName', ''),
-                doc.get('email', ''),
-                doc.get('phone', ''),
-                password,
-                doc.get('role', 'user'),
-                doc.get('isBanned', False),
-                doc.get('isActive', True),
-                doc.get('lastLogin', datetime.now()),
-                doc.get('birthDate'),
-                doc.get('gender'),
-                doc.get('createdAt', datetime.now()),
-                doc.get('updatedAt', datetime.now())
-            ))
-            
-            # Store the mapping
-            id_mappings['users'][str(doc['_id'])] = cursor.lastrowid
+    with load_session() as conn:
+        checkpoint = Checkpoint('users', conn, ['users'])
+        documents = read_bson_file(bson_file, skip=checkpoint.documents)
+        writer = open_writer(conn, 'users', (
+            'first_name', 'last_name', 'email', 'phone', 'password', 'role',
+            'is_banned', 'is_active', 'last_login', 'birth_date', 'gender',
+            'created_at', 'updated_at'
+        ), name='user', mapping=id_mappings['users'])
+        
+        for doc in checkpoint.track(documents, writer):
+            try:
+                # Generate a simple password hash (in production, this should be bcrypt)
+                password = doc.get('password', 'password123')
+                if not password.startswith('$2'):  # Not already hashed
+                    password = f"$2y$12${hashlib.sha256(password.encode()).hexdigest()[:22]}"
+                
+                writer.add((
+                    doc.get('firstName', ''),
+                    doc.get('lastName', ''),
+                    doc.get('email', ''),
+                    doc.get('phone', ''),
+                    password,
+                    doc.get('role', 'user'),
+                    doc.get('isBanned', False),
+                    doc.get('isActive', True),
+                    doc.get('lastLogin', datetime.now()),
+                    doc.get('birthDate'),
+                    doc.get('gender'),
+                    doc.get('createdAt', datetime.now()),
+                    doc.get('updatedAt', datetime.now())
+                ), key=doc['_id'], label=doc.get('email', 'unknown'), source=doc)
             
-        except Exception as e:
-            print(f"Error migrating user {doc.get('email', 'unknown')}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+            except Exception as e:
+                print(f"Error migrating user {doc.get('email', 'unknown')}: {e}")
+        
+        writer.close()
+        checkpoint.complete()
     print("Users migration completed")
 
 def migrate_categories():
@@ -206,56 +2081,117 @@ def migrate_categories():
         return
     
     documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    # First pass - insert all categories without parent
-    for doc in documents:
-        try:
-            cursor.execute("""
-                INSERT INTO categories (name, slug, parent_id, is_active, 
-                                      content, description, meta, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                doc.get('name', ''),
-                doc.get('slug', ''),
-                None,  # Parent will be updated in second pass
-                doc.get('isActive', True),
-                doc.get('content', ''),
-                doc.get('description', ''),
-                json.dumps(convert_objectid_to_string(doc.get('meta', {}))),
-                doc.get('created_at', datetime.now()),
-                doc.get('updated_at', datetime.now())
-            ))
-            
-            # Store the mapping
-            id_mappings['categories'][str(doc['_id'])] = cursor.lastrowid
-            
-        except Exception as e:
-            print(f"Error migrating category {doc.get('name', 'unknown')}: {e}")
-    
-    conn.commit()
-    
-    # Second pass - update parent relationships
-    for doc in documents:
-        if doc.get('parentId'):
+    with load_session() as conn:
+        checkpoint = Checkpoint('categories', conn, ['categories'])
+        writer = open_writer(conn, 'categories', (
+            'name', 'slug', 'parent_id', 'is_active',
+            'content', 'description', 'meta', 'created_at', 'updated_at'
+        ), name='category', mapping=id_mappings['categories'], keep_columns=('slug',))
+        slugs = SlugAllocator.from_table(conn, 'categories')
+        
+        # Parents are written before their children, so every parent_id is
+        # known when the row is added and the tree goes out in bulk
+        mapping = id_mappings['categories']
+        ordered, detached = order_categories(checkpoint.changed(documents), mapping)
+        category_ids = {}
+        
+        for doc in ordered:
             try:
-                parent_mongo_id = str(doc['parentId'])
-                if parent_mongo_id in id_mappings['categories']:
-                    cursor.execute("""
-                        UPDATE categories SET parent_id = %s WHERE id = %s
-                    """, (
-                        id_mappings['categories'][parent_mongo_id],
-                        id_mappings['categories'][str(doc['_id'])]
-                    ))
+                parent_id = None
+                if doc.get('parentId') and doc['_id'] not in detached:
+                    parent_id = category_ids.get(doc['parentId']) or mapping.get(doc['parentId'])
+                
+                # Make slug unique if needed; an updated category keeps its own
+                slug = doc.get('slug', '')
+                if not writer.exists(doc['_id']):
+                    slug = slugs.allocate(slug)
+                
+                category_ids[doc['_id']] = writer.add((
+                    doc.get('name', ''),
+                    slug,
+                    parent_id,
+                    doc.get('isActive', True),
+                    doc.get('content', ''),
+                    doc.get('description', ''),
+                    to_json(doc.get('meta', {})),
+                    doc.get('created_at', datetime.now()),
+                    doc.get('updated_at', datetime.now())
+                ), key=doc['_id'], label=doc.get('name', 'unknown'), source=doc)
+            
             except Exception as e:
-                print(f"Error updating parent for category {doc.get('name', 'unknown')}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+                print(f"Error migrating category {doc.get('name', 'unknown')}: {e}")
+        
+        writer.close()
+        if writer.rejected_ids:
+            # Children of categories that failed to insert lose their parent
+            # rather than point at a missing row
+            cursor = conn.cursor()
+            rejected = list(writer.rejected_ids)
+            cursor.execute(
+                f"UPDATE categories SET parent_id = NULL WHERE parent_id IN ({', '.join(['%s'] * len(rejected))})",
+                rejected
+            )
+            cursor.close()
+        
+        checkpoint.complete()
     print("Categories migration completed")
 
+def order_categories(documents, mapping):
+    """Sort category documents so that every parent precedes its children
+
+    Returns the documents in insert order and the _ids of those that have
+    to be inserted without a parent: categories whose parent is neither
+    among the documents nor in `mapping`, and one category of every parent
+    cycle. Both are reported.
+    """
+    documents = list(documents)
+    by_id = {doc['_id']: doc for doc in documents}
+    children = {}
+    roots = []
+    detached = set()
+    for doc in documents:
+        parent = doc.get('parentId')
+        if parent in by_id:
+            children.setdefault(parent, []).append(doc)
+            continue
+        if parent and parent not in mapping:
+            print(f"Category {doc.get('name', 'unknown')} has unknown parent {parent}, migrating it without parent")
+            detached.add(doc['_id'])
+        roots.append(doc)
+    
+    ordered = []
+    placed = set()
+    
+    def place(queue):
+        queue = deque(queue)
+        while queue:
+            doc = queue.popleft()
+            if doc['_id'] in placed:
+                continue
+            placed.add(doc['_id'])
+            ordered.append(doc)
+            queue.extend(children.get(doc['_id'], ()))
+    
+    place(roots)
+    # Whatever is left hangs off a parent cycle; walk up from the first
+    # one until a category repeats and cut the cycle there
+    for doc in documents:
+        if doc['_id'] in placed:
+            continue
+        path = []
+        seen = set()
+        current = doc
+        while current['_id'] not in seen:
+            seen.add(current['_id'])
+            path.append(current)
+            current = by_id[current['parentId']]
+        cycle = path[path.index(current):]
+        names = ' -> '.join(category.get('name', 'unknown') for category in cycle + [current])
+        print(f"Categories form a parent cycle ({names}), migrating {current.get('name', 'unknown')} without parent")
+        detached.add(current['_id'])
+        place([current])
+    return ordered, detached
+
 def migrate_brands():
     """Migrate brands collection"""
     print("Migrating Brands...")
@@ -266,62 +2202,79 @@ def migrate_brands():
         return
     
     documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    # Get existing brands from database
-    cursor.execute("SELECT name, slug FROM brands")
-    existing_brands = cursor.fetchall()
-    existing_names = {row[0] for row in existing_brands}
-    existing_slugs = {row[1] for row in existing_brands}
-    
-    for doc in documents:
-        try:
-            name = doc.get('name', '')
-            slug = doc.get('slug', '')
-            
-            # Skip if name already exists in database
-            if name in existing_names:
-                print(f"Skipping duplicate brand name: {name}")
-                # Still need to map the ID for relationships
-                cursor.execute("SELECT id FROM brands WHERE name = %s", (name,))
-                result = cursor.fetchone()
-                if result:
-                    id_mappings['brands'][str(doc['_id'])] = result[0]
-                continue
-            
-            # Make slug unique if needed
-            original_slug = slug
-            counter = 1
-            while slug in existing_slugs:
-                slug = f"{original_slug}-{counter}"
-                counter += 1
-            
-            cursor.execute("""
-                INSERT INTO brands (name, slug, logo, is_active, content, 
-                                  created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (
-                name,
-                slug,
-                doc.get('logo'),
-                doc.get('isActive', True),
-                doc.get('content', ''),
-                doc.get('created_at', datetime.now()),
-                doc.get('updated_at', datetime.now())
-            ))
-            
-            # Store the mapping
-            id_mappings['brands'][str(doc['_id'])] = cursor.lastrowid
-            existing_names.add(name)
-            existing_slugs.add(slug)
+    with load_session() as conn:
+        checkpoint = Checkpoint('brands', conn, ['brands'], mappings=['brand_duplicates'])
+        writer = open_writer(conn, 'brands', (
+            'name', 'slug', 'logo', 'is_active', 'content',
+            'created_at', 'updated_at'
+        ), name='brand', mapping=id_mappings['brands'], keep_columns=('slug',))
+        
+        # Brands already in the database, extended as this run inserts more
+        brands = get_brand_index(conn)
+        
+        # Brands inserted by this run, by name; duplicates that follow them in the
+        # file are mapped once the batch holding the first one has been written
+        inserted_names = {}
+        duplicate_brands = []
+        duplicates = id_mappings['brand_duplicates']
+        
+        for doc in checkpoint.changed(documents):
+            try:
+                name = doc.get('name', '')
+                slug = doc.get('slug', '')
+                
+                # A duplicate folded in by an earlier run is mapped to the
+                # other brand's row, which mustn't be updated through it
+                if doc['_id'] in duplicates:
+                    print(f"Skipping duplicate brand name: {name}")
+                    continue
+                
+                # A brand migrated by an earlier run is updated in place and
+                # keeps its slug
+                updating = writer.exists(doc['_id'])
+                
+                # Skip if name already exists in this run or the database,
+                # but still map the ID for relationships
+                if not updating and name in inserted_names:
+                    print(f"Skipping duplicate brand name: {name}")
+                    duplicate_brands.append((doc['_id'], name))
+                    continue
+                if not updating and name in brands.ids:
+                    print(f"Skipping duplicate brand name: {name}")
+                    id_mappings['brands'][doc['_id']] = duplicates[doc['_id']] = brands.ids[name]
+                    continue
+                
+                # Make slug unique if needed
+                if not updating:
+                    slug = brands.slugs.allocate(slug)
+                
+                writer.add((
+                    name,
+                    slug,
+                    doc.get('logo'),
+                    doc.get('isActive', True),
+                    doc.get('content', ''),
+                    doc.get('created_at', datetime.now()),
+                    doc.get('updated_at', datetime.now())
+                ), key=doc['_id'], label=name, source=doc)
+                
+                if not updating:
+                    inserted_names[name] = doc['_id']
             
-        except Exception as e:
-            print(f"Error migrating brand {doc.get('name', 'unknown')}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+            except Exception as e:
+                print(f"Error migrating brand {doc.get('name', 'unknown')}: {e}")
+        
+        writer.close()
+        for name, mongo_id in inserted_names.items():
+            brand_id = id_mappings['brands'].get(mongo_id)
+            if brand_id:
+                brands.add(name, brand_id)
+        for mongo_id, name in duplicate_brands:
+            brand_id = brands.get(name)
+            if brand_id:
+                id_mappings['brands'][mongo_id] = duplicates[mongo_id] = brand_id
+        
+        checkpoint.complete()
     print("Brands migration completed")
 
 def migrate_campaigns():
@@ -333,85 +2286,77 @@ def migrate_campaigns():
         print("Campaigns file not found")
         return
     
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    # Track existing slugs
-    existing_slugs = set()
-    
-    for doc in documents:
-        try:
-            # Map lead form ID
-            lead_form_id = None
-            if doc.get('leadFormId'):
-                mongo_lead_form_id = str(doc['leadFormId'])
-                if mongo_lead_form_id in id_mappings['lead_forms']:
-                    lead_form_id = id_mappings['lead_forms'][mongo_lead_form_id]
-            
-            # Make slug unique if needed
-            slug = doc.get('slug', '')
-            original_slug = slug
-            counter = 1
-            while slug in existing_slugs:
-                slug = f"{original_slug}-{counter}"
-                counter += 1
-            
-            cursor.execute("""
-                INSERT INTO campaigns (slug, title, is_active, is_active_button, image, content,
-                                     link, start_date, end_date, item_type, item_id,
-                                     actuals, coupon_code, meta, is_active_ads, form_id,
-                                     created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                slug,
-                doc.get('title', ''),
-                doc.get('isActive', True),
-                doc.get('isActiveButton', 'join'),
-                doc.get('image'),
-                doc.get('content', ''),
-                doc.get('link'),
-                doc.get('startDate'),
-                doc.get('endDate'),
-                doc.get('itemType', 'general'),
-                doc.get('itemId'),
-                json.dumps(convert_objectid_to_string(doc.get('actuals', []))),
-                doc.get('couponCode'),
-                json.dumps(convert_objectid_to_string(doc.get('meta', {}))),
-                doc.get('isActiveAds', True),
-                lead_form_id,
-                doc.get('created_at', datetime.now()),
-                doc.get('updated_at', datetime.now())
-            ))
-            
-            campaign_id = cursor.lastrowid
-            id_mappings['campaigns'][str(doc['_id'])] = campaign_id
-            existing_slugs.add(slug)
-            
-            # Add brand relationships
-            if doc.get('brandIds'):
-                for brand_mongo_id in doc['brandIds']:
-                    if str(brand_mongo_id) in id_mappings['brands']:
-                        cursor.execute("""
-                            INSERT INTO campaign_brand (campaign_id, brand_id)
-                            VALUES (%s, %s)
-                        """, (campaign_id, id_mappings['brands'][str(brand_mongo_id)]))
-            
-            # Add category relationships
-            if doc.get('categoryIds'):
-                for cat_mongo_id in doc['categoryIds']:
-                    if str(cat_mongo_id) in id_mappings['categories']:
-                        cursor.execute("""
-                            INSERT INTO campaign_category (campaign_id, category_id)
-                            VALUES (%s, %s)
-                        """, (campaign_id, id_mappings['categories'][str(cat_mongo_id)]))
+    with load_session() as conn:
+        checkpoint = Checkpoint('campaigns', conn, ['campaigns'], links={
+            'campaign_brand': ('campaign_id', 'campaigns'),
+            'campaign_category': ('campaign_id', 'campaigns'),
+        })
+        documents = read_bson_file(bson_file, skip=checkpoint.documents)
+        writer = open_writer(conn, 'campaigns', (
+            'slug', 'title', 'is_active', 'is_active_button', 'image', 'content',
+            'link', 'start_date', 'end_date', 'item_type', 'item_id',
+            'actuals', 'coupon_code', 'meta', 'is_active_ads', 'form_id',
+            'created_at', 'updated_at'
+        ), name='campaign', mapping=id_mappings['campaigns'], keep_columns=('slug',))
+        brand_writer = open_writer(conn, 'campaign_brand', ('campaign_id', 'brand_id'), parent=writer)
+        category_writer = open_writer(conn, 'campaign_category', ('campaign_id', 'category_id'), parent=writer)
+        
+        # Track existing slugs, including those committed before a resume
+        slugs = SlugAllocator.from_table(conn, 'campaigns')
+        
+        for doc in checkpoint.track(documents, writer, brand_writer, category_writer):
+            try:
+                # Map lead form ID
+                lead_form_id = None
+                if doc.get('leadFormId'):
+                    lead_form_id = id_mappings['lead_forms'].get(doc['leadFormId'])
+                
+                # Make slug unique if needed; an updated campaign keeps its own
+                slug = doc.get('slug', '')
+                if not writer.exists(doc['_id']):
+                    slug = slugs.allocate(slug)
+                
+                # Brand and category relationships; repeated ids, or brands
+                # merged by name into one, would otherwise fail the whole
+                # pivot batch on a duplicate key
+                brand_ids = dict.fromkeys(id_mappings['brands'].get_many(doc.get('brandIds') or []))
+                category_ids = dict.fromkeys(id_mappings['categories'].get_many(doc.get('categoryIds') or []))
+                
+                row = (
+                    slug,
+                    doc.get('title', ''),
+                    doc.get('isActive', True),
+                    doc.get('isActiveButton', 'join'),
+                    doc.get('image'),
+                    doc.get('content', ''),
+                    doc.get('link'),
+                    doc.get('startDate'),
+                    doc.get('endDate'),
+                    doc.get('itemType', 'general'),
+                    doc.get('itemId'),
+                    to_json(doc.get('actuals', [])),
+                    doc.get('couponCode'),
+                    to_json(doc.get('meta', {})),
+                    doc.get('isActiveAds', True),
+                    lead_form_id,
+                    doc.get('created_at', datetime.now()),
+                    doc.get('updated_at', datetime.now())
+                )
+                
+                campaign_id = writer.add(row, key=doc['_id'], label=doc.get('title', 'unknown'), source=doc)
+                
+                for brand_id in brand_ids:
+                    brand_writer.add((campaign_id, brand_id), source=doc)
+                for category_id in category_ids:
+                    category_writer.add((campaign_id, category_id), source=doc)
             
-        except Exception as e:
-            print(f"Error migrating campaign {doc.get('title', 'unknown')}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+            except Exception as e:
+                print(f"Error migrating campaign {doc.get('title', 'unknown')}: {e}")
+        
+        brand_writer.close()
+        category_writer.close()
+        writer.close()
+        checkpoint.complete()
     print("Campaigns migration completed")
 
 def migrate_posts():
@@ -423,44 +2368,46 @@ def migrate_posts():
         print("Posts file not found")
         return
     
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    for doc in documents:
-        try:
-            cursor.execute("""
-                INSERT INTO posts (slug, title, content, image, meta,
-                                 created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (
-                doc.get('slug', ''),
-                doc.get('title', ''),
-                doc.get('content', ''),
-                doc.get('image'),
-                json.dumps(convert_objectid_to_string(doc.get('meta', {}))),
-                doc.get('created_at', datetime.now()),
-                doc.get('updated_at', datetime.now())
-            ))
-            
-            post_id = cursor.lastrowid
-            id_mappings['posts'][str(doc['_id'])] = post_id
-            
-            # Add category relationships
-            if doc.get('categoryIds'):
-                for cat_mongo_id in doc['categoryIds']:
-                    if str(cat_mongo_id) in id_mappings['categories']:
-                        cursor.execute("""
-                            INSERT INTO category_post (category_id, post_id)
-                            VALUES (%s, %s)
-                        """, (id_mappings['categories'][str(cat_mongo_id)], post_id))
+    with load_session() as conn:
+        checkpoint = Checkpoint('posts', conn, ['posts'], links={'category_post': ('post_id', 'posts')})
+        documents = read_bson_file(bson_file, skip=checkpoint.documents)
+        writer = open_writer(conn, 'posts', (
+            'slug', 'title', 'content', 'image', 'meta',
+            'created_at', 'updated_at'
+        ), name='post', mapping=id_mappings['posts'], keep_columns=('slug',))
+        category_writer = open_writer(conn, 'category_post', ('category_id', 'post_id'), parent=writer, parent_column=1)
+        slugs = SlugAllocator.from_table(conn, 'posts')
+        
+        for doc in checkpoint.track(documents, writer, category_writer):
+            try:
+                # Category relationships, without repeats
+                category_ids = dict.fromkeys(id_mappings['categories'].get_many(doc.get('categoryIds') or []))
+                
+                # Make slug unique if needed; an updated post keeps its own
+                slug = doc.get('slug', '')
+                if not writer.exists(doc['_id']):
+                    slug = slugs.allocate(slug)
+                
+                row = (
+                    slug,
+                    doc.get('title', ''),
+                    doc.get('content', ''),
+                    doc.get('image'),
+                    to_json(doc.get('meta', {})),
+                    doc.get('created_at', datetime.now()),
+                    doc.get('updated_at', datetime.now())
+                )
+                
+                post_id = writer.add(row, key=doc['_id'], label=doc.get('title', 'unknown'), source=doc)
+                for category_id in category_ids:
+                    category_writer.add((category_id, post_id), source=doc)
             
-        except Exception as e:
-            print(f"Error migrating post {doc.get('title', 'unknown')}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+            except Exception as e:
+                print(f"Error migrating post {doc.get('title', 'unknown')}: {e}")
+        
+        category_writer.close()
+        writer.close()
+        checkpoint.complete()
     print("Posts migration completed")
 
 def migrate_lead_forms():
@@ -472,34 +2419,31 @@ def migrate_lead_forms():
         print("Lead Forms file not found")
         return
     
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    for doc in documents:
-        try:
-            cursor.execute("""
-                INSERT INTO lead_forms (name, description, button_text, is_category_show,
-                                      fields, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (
-                doc.get('name', ''),
-                doc.get('description', ''),
-                doc.get('buttonText', 'Gönder'),
-                doc.get('isCategoryShow', False),
-                json.dumps(convert_objectid_to_string(doc.get('fields', []))),
-                doc.get('created_at', datetime.now()),
-                doc.get('updated_at', datetime.now())
-            ))
-            
-            id_mappings['lead_forms'][str(doc['_id'])] = cursor.lastrowid
+    with load_session() as conn:
+        checkpoint = Checkpoint('lead_forms', conn, ['lead_forms'])
+        documents = read_bson_file(bson_file, skip=checkpoint.documents)
+        writer = open_writer(conn, 'lead_forms', (
+            'name', 'description', 'button_text', 'is_category_show',
+            'fields', 'created_at', 'updated_at'
+        ), name='lead form', mapping=id_mappings['lead_forms'])
+        
+        for doc in checkpoint.track(documents, writer):
+            try:
+                writer.add((
+                    doc.get('name', ''),
+                    doc.get('description', ''),
+                    doc.get('buttonText', 'Gönder'),
+                    doc.get('isCategoryShow', False),
+                    to_json(doc.get('fields', [])),
+                    doc.get('created_at', datetime.now()),
+                    doc.get('updated_at', datetime.now())
+                ), key=doc['_id'], label=doc.get('name', 'unknown'), source=doc)
             
-        except Exception as e:
-            print(f"Error migrating lead form {doc.get('name', 'unknown')}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+            except Exception as e:
+                print(f"Error migrating lead form {doc.get('name', 'unknown')}: {e}")
+        
+        writer.close()
+        checkpoint.complete()
     print("Lead Forms migration completed")
 
 def migrate_pages():
@@ -511,33 +2455,36 @@ def migrate_pages():
         print("Pages file not found")
         return
     
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    for doc in documents:
-        try:
-            cursor.execute("""
-                INSERT INTO pages (slug, title, content, meta,
-                                 created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                doc.get('slug', ''),
-                doc.get('title', ''),
-                doc.get('content', ''),
-                json.dumps(convert_objectid_to_string(doc.get('meta', {}))),
-                doc.get('createdAt', datetime.now()),
-                doc.get('updatedAt', datetime.now())
-            ))
-            
-            id_mappings['pages'][str(doc['_id'])] = cursor.lastrowid
+    with load_session() as conn:
+        checkpoint = Checkpoint('pages', conn, ['pages'])
+        documents = read_bson_file(bson_file, skip=checkpoint.documents)
+        writer = open_writer(conn, 'pages', (
+            'slug', 'title', 'content', 'meta',
+            'created_at', 'updated_at'
+        ), name='page', mapping=id_mappings['pages'], keep_columns=('slug',))
+        slugs = SlugAllocator.from_table(conn, 'pages')
+        
+        for doc in checkpoint.track(documents, writer):
+            try:
+                # Make slug unique if needed; an updated page keeps its own
+                slug = doc.get('slug', '')
+                if not writer.exists(doc['_id']):
+                    slug = slugs.allocate(slug)
+                
+                writer.add((
+                    slug,
+                    doc.get('title', ''),
+                    doc.get('content', ''),
+                    to_json(doc.get('meta', {})),
+                    doc.get('createdAt', datetime.now()),
+                    doc.get('updatedAt', datetime.now())
+                ), key=doc['_id'], label=doc.get('title', 'unknown'), source=doc)
             
-        except Exception as e:
-            print(f"Error migrating page {doc.get('title', 'unknown')}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+            except Exception as e:
+                print(f"Error migrating page {doc.get('title', 'unknown')}: {e}")
+        
+        writer.close()
+        checkpoint.complete()
     print("Pages migration completed")
 
 def migrate_banks():
@@ -549,49 +2496,44 @@ def migrate_banks():
         print("Banks file not found")
         return
     
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    for doc in documents:
-        try:
-            # Map brand ID
-            brand_id = None
-            if doc.get('brandId'):
-                mongo_brand_id = str(doc['brandId'])
-                if mongo_brand_id in id_mappings['brands']:
-                    brand_id = id_mappings['brands'][mongo_brand_id]
-                else:
-                    print(f"Brand not found for bank: {mongo_brand_id}")
-                    continue
-            
-            cursor.execute("""
-                INSERT INTO banks (brand_id, content, faqs, personal, mortgage,
-                                 new_car, used_car, is_active, sponsored_status,
-                                 created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                brand_id,
-                doc.get('content', ''),
-                json.dumps(convert_objectid_to_string(doc.get('faqs', []))),
-                json.dumps(convert_objectid_to_string(doc.get('personal', {}))),
-                json.dumps(convert_objectid_to_string(doc.get('mortgage', {}))),
-                json.dumps(convert_objectid_to_string(doc.get('newCar', {}))),
-                json.dumps(convert_objectid_to_string(doc.get('usedCar', {}))),
-                doc.get('isActive', True),
-                doc.get('sponsoredStatus', False),
-                datetime.now(),
-                datetime.now()
-            ))
-            
-            id_mappings['banks'][str(doc['_id'])] = cursor.lastrowid
+    with load_session() as conn:
+        checkpoint = Checkpoint('banks', conn, ['banks'])
+        documents = read_bson_file(bson_file, skip=checkpoint.documents)
+        writer = open_writer(conn, 'banks', (
+            'brand_id', 'content', 'faqs', 'personal', 'mortgage',
+            'new_car', 'used_car', 'is_active', 'sponsored_status',
+            'created_at', 'updated_at'
+        ), name='bank', mapping=id_mappings['banks'])
+        
+        for doc in checkpoint.track(documents, writer):
+            try:
+                # Map brand ID
+                brand_id = None
+                if doc.get('brandId'):
+                    brand_id = id_mappings['brands'].get(doc['brandId'])
+                    if brand_id is None:
+                        print(f"Brand not found for bank: {doc['brandId']}")
+                        continue
+                
+                writer.add((
+                    brand_id,
+                    doc.get('content', ''),
+                    to_json(doc.get('faqs', [])),
+                    to_json(doc.get('personal', {})),
+                    to_json(doc.get('mortgage', {})),
+                    to_json(doc.get('newCar', {})),
+                    to_json(doc.get('usedCar', {})),
+                    doc.get('isActive', True),
+                    doc.get('sponsoredStatus', False),
+                    datetime.now(),
+                    datetime.now()
+                ), key=doc['_id'], label=str(doc['_id']), source=doc)
             
-        except Exception as e:
-            print(f"Error migrating bank: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+            except Exception as e:
+                print(f"Error migrating bank: {e}")
+        
+        writer.close()
+        checkpoint.complete()
     print("Banks migration completed")
 
 def migrate_sliders():
@@ -603,33 +2545,30 @@ def migrate_sliders():
         print("Sliders file not found")
         return
     
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    for doc in documents:
-        try:
-            cursor.execute("""
-                INSERT INTO sliders (name, image, link, is_active,
-                                   created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                doc.get('name', ''),
-                doc.get('image'),
-                doc.get('link'),
-                doc.get('isActive', True),
-                doc.get('createdAt', datetime.now()),
-                doc.get('updatedAt', datetime.now())
-            ))
-            
-            id_mappings['sliders'][str(doc['_id'])] = cursor.lastrowid
+    with load_session() as conn:
+        checkpoint = Checkpoint('sliders', conn, ['sliders'])
+        documents = read_bson_file(bson_file, skip=checkpoint.documents)
+        writer = open_writer(conn, 'sliders', (
+            'name', 'image', 'link', 'is_active',
+            'created_at', 'updated_at'
+        ), name='slider', mapping=id_mappings['sliders'])
+        
+        for doc in checkpoint.track(documents, writer):
+            try:
+                writer.add((
+                    doc.get('name', ''),
+                    doc.get('image'),
+                    doc.get('link'),
+                    doc.get('isActive', True),
+                    doc.get('createdAt', datetime.now()),
+                    doc.get('updatedAt', datetime.now())
+                ), key=doc['_id'], label=doc.get('name', 'unknown'), source=doc)
             
-        except Exception as e:
-            print(f"Error migrating slider {doc.get('name', 'unknown')}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+            except Exception as e:
+                print(f"Error migrating slider {doc.get('name', 'unknown')}: {e}")
+        
+        writer.close()
+        checkpoint.complete()
     print("Sliders migration completed")
 
 def migrate_ads():
@@ -641,99 +2580,152 @@ def migrate_ads():
         print("Ads file not found")
         return
     
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    for doc in documents:
-        try:
-            cursor.execute("""
-                INSERT INTO ads (name, type, item_type, device, item, image, link,
-                               code, is_active, position, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                doc.get('name', ''),
-                doc.get('type', ''),
-                doc.get('itemType', ''),
-                doc.get('device'),
-                doc.get('item'),
-                doc.get('image'),
-                doc.get('link'),
-                doc.get('code'),
-                doc.get('isActive', True),
-                doc.get('position', ''),
-                doc.get('createdAt', datetime.now()),
-                doc.get('updatedAt', datetime.now())
-            ))
-            
-            id_mappings['ads'][str(doc['_id'])] = cursor.lastrowid
+    with load_session() as conn:
+        checkpoint = Checkpoint('ads', conn, ['ads'])
+        documents = read_bson_file(bson_file, skip=checkpoint.documents)
+        writer = open_writer(conn, 'ads', (
+            'name', 'type', 'item_type', 'device', 'item', 'image', 'link',
+            'code', 'is_active', 'position', 'created_at', 'updated_at'
+        ), name='ad', mapping=id_mappings['ads'])
+        
+        for doc in checkpoint.track(documents, writer):
+            try:
+                writer.add((
+                    doc.get('name', ''),
+                    doc.get('type', ''),
+                    doc.get('itemType', ''),
+                    doc.get('device'),
+                    doc.get('item'),
+                    doc.get('image'),
+                    doc.get('link'),
+                    doc.get('code'),
+                    doc.get('isActive', True),
+                    doc.get('position', ''),
+                    doc.get('createdAt', datetime.now()),
+                    doc.get('updatedAt', datetime.now())
+                ), key=doc['_id'], label=doc.get('name', 'unknown'), source=doc)
             
-        except Exception as e:
-            print(f"Error migrating ad {doc.get('name', 'unknown')}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+            except Exception as e:
+                print(f"Error migrating ad {doc.get('name', 'unknown')}: {e}")
+        
+        writer.close()
+        checkpoint.complete()
     print("Ads migration completed")
 
-def migrate_leads():
-    """Migrate leads collection"""
-    print("Migrating Leads...")
-    
-    bson_file = os.path.join(MONGO_BACKUP_PATH, "Lead.bson")
-    if not os.path.exists(bson_file):
-        print("Leads file not found")
-        return
-    
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    for doc in documents:
+def load_leads(conn, documents, track, first_id=None):
+    """Write lead documents, letting `track` decide when to commit"""
+    writer = open_writer(conn, 'leads', (
+        'campaign_id', 'form_values', 'interest_categories',
+        'created_at', 'updated_at'
+    ), name='lead', mapping=id_mappings['leads'], first_id=first_id)
+    
+    for doc in track(documents, writer):
         try:
             # Map campaign ID
             campaign_id = None
             if doc.get('campaignId'):
-                mongo_campaign_id = str(doc['campaignId'])
-                if mongo_campaign_id in id_mappings['campaigns']:
-                    campaign_id = id_mappings['campaigns'][mongo_campaign_id]
+                campaign_id = id_mappings['campaigns'].get(doc['campaignId'])
             
             # Map user ID
             user_id = None
             if doc.get('userId'):
-                mongo_user_id = str(doc['userId'])
-                if mongo_user_id in id_mappings['users']:
-                    user_id = id_mappings['users'][mongo_user_id]
+                user_id = id_mappings['users'].get(doc['userId'])
             
             # Map form ID
             form_id = None
             if doc.get('formId'):
-                mongo_form_id = str(doc['formId'])
-                if mongo_form_id in id_mappings['lead_forms']:
-                    form_id = id_mappings['lead_forms'][mongo_form_id]
+                form_id = id_mappings['lead_forms'].get(doc['formId'])
             
-            cursor.execute("""
-                INSERT INTO leads (campaign_id, form_values, interest_categories,
-                                 created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (
+            writer.add((
                 campaign_id,
-                json.dumps(convert_objectid_to_string(doc.get('formValues', []))),
-                json.dumps(convert_objectid_to_string(doc.get('interestCategories', []))),
+                to_json(doc.get('formValues', [])),
+                to_json(doc.get('interestCategories', [])),
                 doc.get('createdAt', datetime.now()),
                 doc.get('updatedAt', datetime.now())
-            ))
-            
-            id_mappings['leads'][str(doc['_id'])] = cursor.lastrowid
-            
+            ), key=doc['_id'], label=str(doc['_id']), source=doc)
+        
         except Exception as e:
             print(f"Error migrating lead: {e}")
     
-    conn.commit()
-    cursor.close()
-    conn.close()
+    writer.close()
+
+def migrate_leads():
+    """Migrate leads collection"""
+    print("Migrating Leads...")
+    
+    bson_file = os.path.join(MONGO_BACKUP_PATH, "Lead.bson")
+    if not os.path.exists(bson_file):
+        print("Leads file not found")
+        return
+    
+    if load_in_ranges():
+        migrate_in_ranges('leads', bson_file)
+    else:
+        with load_session() as conn:
+            checkpoint = Checkpoint('leads', conn, ['leads'])
+            documents = read_bson_file(bson_file, skip=checkpoint.documents)
+            load_leads(conn, documents, checkpoint.track)
+            checkpoint.complete()
     print("Leads migration completed")
 
+def prepare_product(doc):
+    """Build a product's row apart from the brand id (runs in a worker process)"""
+    # Handle datetime - could be datetime object or timestamp
+    created_at = doc.get('createdAt', datetime.now())
+    if isinstance(created_at, (int, float)):
+        # Convert timestamp (milliseconds) to datetime
+        created_at = datetime.fromtimestamp(created_at / 1000)
+    elif not isinstance(created_at, datetime):
+        created_at = datetime.now()
+    
+    updated_at = doc.get('updatedAt', datetime.now())
+    if isinstance(updated_at, (int, float)):
+        updated_at = datetime.fromtimestamp(updated_at / 1000)
+    elif not isinstance(updated_at, datetime):
+        updated_at = datetime.now()
+    
+    # Extract price from stores
+    stores = doc.get('stores', [])
+    price = None
+    image = None
+    images = []
+    
+    if stores and len(stores) > 0:
+        # Get lowest price from stores
+        prices = [float(store.get('price', 0)) for store in stores if store.get('price')]
+        if prices:
+            price = min(prices)
+        
+        # Get first available image
+        for store in stores:
+            if store.get('image_link'):
+                if not image:
+                    image = store.get('image_link')
+                images.append(store.get('image_link'))
+    
+    return {
+        '_id': doc['_id'],
+        'updatedAt': document_timestamp(doc),
+        'gtin': doc.get('gtin', ''),
+        'brand': doc.get('brand', ''),
+        'row': (
+            doc.get('title'),
+            doc.get('gtin', ''),
+            doc.get('description'),
+            to_json(doc.get('attributes', [])),
+            to_json(stores),
+            to_json(images) if images else None,
+            image,
+            price,
+            created_at,
+            updated_at
+        ),
+    }
+
+# GTINs of the products an export has written, since there is no products
+# table to read them back from
+exported_gtins = set()
+
 def migrate_products():
     """Migrate products collection"""
     print("Migrating Products...")
@@ -743,127 +2735,135 @@ def migrate_products():
         print("Products file not found")
         return
     
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    # Get brand name to ID mapping
-    cursor.execute("SELECT id, name FROM brands")
-    brand_mapping = {row[1]: row[0] for row in cursor.fetchall()}
-    
-    for doc in documents:
-        try:
-            # Map brand name to brand_id
-            brand_name = doc.get('brand', '')
-            brand_id = brand_mapping.get(brand_name) if brand_name else None
-            
-            # Handle datetime - could be datetime object or timestamp
-            created_at = doc.get('createdAt', datetime.now())
-            if isinstance(created_at, (int, float)):
-                # Convert timestamp (milliseconds) to datetime
-                created_at = datetime.fromtimestamp(created_at / 1000)
-            elif not isinstance(created_at, datetime):
-                created_at = datetime.now()
-                
-            updated_at = doc.get('updatedAt', datetime.now())
-            if isinstance(updated_at, (int, float)):
-                updated_at = datetime.fromtimestamp(updated_at / 1000)
-            elif not isinstance(updated_at, datetime):
-                updated_at = datetime.now()
-            
-            # Extract price from stores
-            stores = doc.get('stores', [])
-            price = None
-            image = None
-            images = []
-            
-            if stores and len(stores) > 0:
-                # Get lowest price from stores
-                prices = [float(store.get('price', 0)) for store in stores if store.get('price')]
-                if prices:
-                    price = min(prices)
+    with load_session() as conn:
+        checkpoint = Checkpoint('products', conn, ['products'])
+        writer = open_writer(conn, 'products', (
+            'title', 'gtin', 'description', 'brand_id',
+            'attributes', 'stores', 'images', 'image', 'price',
+            'created_at', 'updated_at'
+        ), name='product', mapping=id_mappings['products'])
+        
+        # Brand name to ID mapping shared with migrate_brands
+        brands = get_brand_index(conn)
+        
+        documents = prepare_in_processes(bson_file, prepare_product, since=checkpoint.since,
+                                         skip=checkpoint.documents)
+        for doc in checkpoint.track(documents, writer):
+            if '_error' in doc:
+                print(f"Error migrating product {doc.get('gtin', 'unknown')}: {doc['_error']}")
+                continue
+            try:
+                # Map brand name to brand_id
+                row = doc['row']
+                brand_id = brands.get(doc['brand'])
                 
-                # Get first available image
-                for store in stores:
-                    if store.get('image_link'):
-                        if not image:
-                            image = store.get('image_link')
-                        images.append(store.get('image_link'))
-            
-            cursor.execute("""
-                INSERT INTO products (title, gtin, description, brand_id,
-                                    attributes, stores, images, image, price,
-                                    created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                doc.get('title'),
-                doc.get('gtin', ''),
-                doc.get('description'),
-                brand_id,
-                json.dumps(convert_objectid_to_string(doc.get('attributes', []))),
-                json.dumps(convert_objectid_to_string(stores)),
-                json.dumps(images) if images else None,
-                image,
-                price,
-                created_at,
-                updated_at
-            ))
-            
-            id_mappings['products'][str(doc['_id'])] = cursor.lastrowid
+                writer.add(row[:3] + (brand_id,) + row[3:], key=doc['_id'], label=doc['gtin'], source=doc)
+                if conn is None:
+                    exported_gtins.add(row[1])
             
-        except Exception as e:
-            print(f"Error migrating product {doc.get('gtin', 'unknown')}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+            except Exception as e:
+                print(f"Error migrating product {doc.get('gtin', 'unknown')}: {e}")
+        
+        writer.close()
+        checkpoint.complete()
     print("Products migration completed")
 
-def migrate_product_price_histories():
-    """Migrate product price histories collection"""
-    print("Migrating Product Price Histories...")
-    
-    bson_file = os.path.join(MONGO_BACKUP_PATH, "ProductPriceHistory.bson")
-    if not os.path.exists(bson_file):
-        print("Product Price Histories file not found")
-        return
-    
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
+def load_product_gtins(conn):
+    """Stream every product GTIN into a set for local existence checks"""
+    if conn is None:
+        return exported_gtins
+    gtins = set()
     cursor = conn.cursor()
-    
-    for doc in documents:
+    cursor.execute("SELECT gtin FROM products WHERE gtin IS NOT NULL")
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        gtins.update(row[0] for row in rows)
+    cursor.close()
+    return gtins
+
+def load_product_price_histories(conn, documents, track, first_id=None):
+    """Write price history documents, returning the skipped ones per unknown GTIN
+
+    Histories have no updatedAt, so they are mapped like other documents
+    for an incremental run to tell the ones it already migrated.
+    """
+    writer = open_writer(conn, 'product_price_histories', (
+        'gtin', 'date', 'store_price', 'store_brand', 'created_at', 'updated_at'
+    ), name='product price history', mapping=id_mappings['product_price_histories'], first_id=first_id)
+    
+    # Check product existence locally instead of querying once per history
+    product_gtins = load_product_gtins(conn)
+    missing_gtins = Counter()
+    
+    for doc in track(documents, writer):
         try:
             gtin = doc.get('gtin', '')
             
-            # Check if product exists
-            cursor.execute("SELECT id FROM products WHERE gtin = %s", (gtin,))
-            result = cursor.fetchone()
-            
-            if result:
+            if gtin in product_gtins:
                 # Insert price history with gtin, date, store_price, store_brand
-                cursor.execute("""
-                    INSERT INTO product_price_histories (gtin, date, store_price, store_brand, created_at, updated_at)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (
+                writer.add((
                     gtin,
                     doc.get('date', datetime.now().date()),
                     doc.get('storePrice', 0.0),
                     doc.get('storeBrand', ''),
                     datetime.now(),
                     datetime.now()
-                ))
+                ), key=doc['_id'], label=gtin, source=doc)
             else:
-                print(f"Product not found for GTIN: {gtin}")
-            
+                missing_gtins[gtin] += 1
+        
         except Exception as e:
             print(f"Error migrating product price history: {e}")
     
-    conn.commit()
-    cursor.close()
-    conn.close()
+    writer.close()
+    return missing_gtins
+
+def migrate_product_price_histories():
+    """Migrate product price histories collection"""
+    print("Migrating Product Price Histories...")
+    
+    bson_file = os.path.join(MONGO_BACKUP_PATH, "ProductPriceHistory.bson")
+    if not os.path.exists(bson_file):
+        print("Product Price Histories file not found")
+        return
+    
+    if load_in_ranges():
+        missing_gtins = sum(migrate_in_ranges('product_price_histories', bson_file), Counter())
+    else:
+        with load_session() as conn:
+            checkpoint = Checkpoint('product_price_histories', conn, ['product_price_histories'])
+            documents = read_bson_file(bson_file, skip=checkpoint.documents)
+            missing_gtins = load_product_price_histories(conn, documents, checkpoint.track)
+            checkpoint.complete()
+    
+    if missing_gtins:
+        print(f"Skipped {sum(missing_gtins.values())} product price histories "
+              f"for {len(missing_gtins)} unknown GTINs")
+        for gtin, count in missing_gtins.most_common(MISSING_GTIN_EXAMPLES):
+            print(f"  Product not found for GTIN: {gtin} ({count} skipped)")
     print("Product Price Histories migration completed")
 
+def prepare_car(doc):
+    """Build a car's row (runs in a worker process)"""
+    return {
+        '_id': doc['_id'],
+        'updatedAt': document_timestamp(doc),
+        'model': doc.get('model', 'unknown'),
+        'row': (
+            doc.get('model', ''),
+            doc.get('brand', ''),
+            to_json(doc.get('historyPrices', [])),
+            to_json(doc.get('attributes', [])),
+            to_json(doc.get('images', [])),
+            to_json(doc.get('euroncap', {})),
+            to_json(doc.get('colors', [])),
+            datetime.now(),
+            datetime.now()
+        ),
+    }
+
 def migrate_cars():
     """Migrate cars collection"""
     print("Migrating Cars...")
@@ -873,36 +2873,27 @@ def migrate_cars():
         print("Cars file not found")
         return
     
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    for doc in documents:
-        try:
-            cursor.execute("""
-                INSERT INTO cars (model, brand, history_prices, attributes,
-                                images, euroncap, colors, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                doc.get('model', ''),
-                doc.get('brand', ''),
-                json.dumps(convert_objectid_to_string(doc.get('historyPrices', []))),
-                json.dumps(convert_objectid_to_string(doc.get('attributes', []))),
-                json.dumps(convert_objectid_to_string(doc.get('images', []))),
-                json.dumps(convert_objectid_to_string(doc.get('euroncap', {}))),
-                json.dumps(convert_objectid_to_string(doc.get('colors', []))),
-                datetime.now(),
-                datetime.now()
-            ))
-            
-            id_mappings['cars'][str(doc['_id'])] = cursor.lastrowid
+    with load_session() as conn:
+        checkpoint = Checkpoint('cars', conn, ['cars'])
+        writer = open_writer(conn, 'cars', (
+            'model', 'brand', 'history_prices', 'attributes',
+            'images', 'euroncap', 'colors', 'created_at', 'updated_at'
+        ), name='car', mapping=id_mappings['cars'])
+        
+        documents = prepare_in_processes(bson_file, prepare_car, since=checkpoint.since,
+                                         skip=checkpoint.documents)
+        for doc in checkpoint.track(documents, writer):
+            if '_error' in doc:
+                print(f"Error migrating car {doc.get('model', 'unknown')}: {doc['_error']}")
+                continue
+            try:
+                writer.add(doc['row'], key=doc['_id'], label=doc['model'], source=doc)
             
-        except Exception as e:
-            print(f"Error migrating car {doc.get('model', 'unknown')}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+            except Exception as e:
+                print(f"Error migrating car {doc.get('model', 'unknown')}: {e}")
+        
+        writer.close()
+        checkpoint.complete()
     print("Cars migration completed")
 
 def migrate_real_estates():
@@ -914,47 +2905,44 @@ def migrate_real_estates():
         print("Real Estates file not found")
         return
     
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    for doc in documents:
-        try:
-            cursor.execute("""
-                INSERT INTO real_estates (name, delivery_date, unit_delivery, property_type,
-                                        number_of_units, floor_count, elevator, parking,
-                                        heating, maps_url, images, price_plans, owners,
-                                        country, city, district, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                doc.get('name', ''),
-                doc.get('deliveryDate'),
-                doc.get('unitDelivery', ''),
-                doc.get('propertyType', ''),
-                doc.get('numberOfUnits', 0),
-                doc.get('floorCount', 0),
-                doc.get('elevator', ''),
-                doc.get('parking', ''),
-                doc.get('heating', ''),
-                doc.get('mapsUrl', ''),
-                json.dumps(convert_objectid_to_string(doc.get('images', []))),
-                json.dumps(convert_objectid_to_string(doc.get('pricePlans', []))),
-                json.dumps(convert_objectid_to_string(doc.get('owners', []))),
-                doc.get('country', 'Turkiye'),
-                doc.get('city', ''),
-                doc.get('district', ''),
-                datetime.now(),
-                datetime.now()
-            ))
-            
-            id_mappings['real_estates'][str(doc['_id'])] = cursor.lastrowid
+    with load_session() as conn:
+        checkpoint = Checkpoint('real_estates', conn, ['real_estates'])
+        documents = read_bson_file(bson_file, skip=checkpoint.documents)
+        writer = open_writer(conn, 'real_estates', (
+            'name', 'delivery_date', 'unit_delivery', 'property_type',
+            'number_of_units', 'floor_count', 'elevator', 'parking',
+            'heating', 'maps_url', 'images', 'price_plans', 'owners',
+            'country', 'city', 'district', 'created_at', 'updated_at'
+        ), name='real estate', mapping=id_mappings['real_estates'])
+        
+        for doc in checkpoint.track(documents, writer):
+            try:
+                writer.add((
+                    doc.get('name', ''),
+                    doc.get('deliveryDate'),
+                    doc.get('unitDelivery', ''),
+                    doc.get('propertyType', ''),
+                    doc.get('numberOfUnits', 0),
+                    doc.get('floorCount', 0),
+                    doc.get('elevator', ''),
+                    doc.get('parking', ''),
+                    doc.get('heating', ''),
+                    doc.get('mapsUrl', ''),
+                    to_json(doc.get('images', [])),
+                    to_json(doc.get('pricePlans', [])),
+                    to_json(doc.get('owners', [])),
+                    doc.get('country', 'Turkiye'),
+                    doc.get('city', ''),
+                    doc.get('district', ''),
+                    datetime.now(),
+                    datetime.now()
+                ), key=doc['_id'], label=doc.get('name', 'unknown'), source=doc)
             
-        except Exception as e:
-            print(f"Error migrating real estate {doc.get('name', 'unknown')}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+            except Exception as e:
+                print(f"Error migrating real estate {doc.get('name', 'unknown')}: {e}")
+        
+        writer.close()
+        checkpoint.complete()
     print("Real Estates migration completed")
 
 def migrate_attributes():
@@ -966,65 +2954,618 @@ def migrate_attributes():
         print("Attributes file not found")
         return
     
-    documents = read_bson_file(bson_file)
-    conn = get_mysql_connection()
-    cursor = conn.cursor()
-    
-    for doc in documents:
-        try:
-            cursor.execute("""
-                INSERT INTO attributes (name, type, created_at, updated_at)
-                VALUES (%s, %s, %s, %s)
-            """, (
-                doc.get('name', ''),
-                doc.get('type', ''),
-                datetime.now(),
-                datetime.now()
-            ))
-            
-            id_mappings['attributes'][str(doc['_id'])] = cursor.lastrowid
+    with load_session() as conn:
+        checkpoint = Checkpoint('attributes', conn, ['attributes'])
+        documents = read_bson_file(bson_file, skip=checkpoint.documents)
+        writer = open_writer(conn, 'attributes', (
+            'name', 'type', 'created_at', 'updated_at'
+        ), name='attribute', mapping=id_mappings['attributes'])
+        
+        for doc in checkpoint.track(documents, writer):
+            try:
+                writer.add((
+                    doc.get('name', ''),
+                    doc.get('type', ''),
+                    datetime.now(),
+                    datetime.now()
+                ), key=doc['_id'], label=doc.get('name', 'unknown'), source=doc)
             
-        except Exception as e:
-            print(f"Error migrating attribute {doc.get('name', 'unknown')}: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+            except Exception as e:
+                print(f"Error migrating attribute {doc.get('name', 'unknown')}: {e}")
+        
+        writer.close()
+        checkpoint.complete()
     print("Attributes migration completed")
 
-def migrate_all():
-    """Run all migrations in order"""
+# Collections --ranges can load in parallel: their loader, the table it
+# fills and the id mappings it looks foreign keys up in
+RANGE_LOADERS = {
+    'product_price_histories': (load_product_price_histories, 'product_price_histories', ()),
+    'leads': (load_leads, 'leads', ('campaigns', 'users', 'lead_forms')),
+}
+
+def load_in_ranges():
+    """Return whether range loaders split their files in this run
+
+    Incremental runs and exports load every collection in one piece.
+    """
+    return RANGES > 1 and not _incremental and not _export_format
+
+def committing(commit, documents, *writers):
+    """Yield documents, calling commit(*writers) every CHECKPOINT_EVERY"""
+    for count, doc in enumerate(documents, 1):
+        yield doc
+        raise_writer_error(writers)
+        if count % CHECKPOINT_EVERY == 0:
+            commit(*writers)
+
+def load_range(name, bson_file, start, end, first_id, lookups, load_mode, use_pure):
+    """Load one byte range of a BSON file on its own connection (runs in a worker process)
+
+    The id mappings of its rows are stored in ID_MAP_TABLE with every
+    commit and then forgotten, so the worker never holds more than one
+    commit's worth. Returns the range's Stage and what the loader returned.
+    """
+    global POOL_SIZE, MONGO_BACKUP_PATH, LOAD_MODE, USE_PURE
+    # The worker only ever needs the one connection, and looks up the
+    # documents of rejected rows next to the file it loads. It starts from
+    # a fresh import of this file, so the run's load mode and connector
+    # implementation are passed along.
+    POOL_SIZE = 1
+    MONGO_BACKUP_PATH = os.path.dirname(bson_file)
+    LOAD_MODE = load_mode
+    USE_PURE = use_pure
+    loader, table, _ = RANGE_LOADERS[name]
+    for lookup_table, records in lookups.items():
+        id_mappings[lookup_table].restore(MAPPING_RECORD.iter_unpack(records))
+    stage = Stage(f"{name} [{start}:{end}]")
+    _current_stage.stage = stage
+    options = {'first_id': first_id} if first_id is not None else {}
+    mapping = id_mappings.get(table)
+    with load_session() as conn:
+        id_writer = BatchWriter(conn, ID_MAP_TABLE, ('table_name', 'mongo_id', 'mysql_id'),
+                                name='id mapping', upsert=True)
+
+        def commit(*writers):
+            for writer in writers:
+                writer.flush()
+            if mapping is not None:
+                for binary, mysql_id in mapping.pending:
+                    id_writer.add((table, binary, mysql_id), label=binary.hex())
+                mapping.pending.clear()
+                id_writer.flush()
+            conn.commit()
+
+        result = loader(conn, read_bson_file(bson_file, start, end), partial(committing, commit), **options)
+        commit()
+        id_writer.close()
+    stage.finish('done')
+    return stage, result
+
+def migrate_in_ranges(name, bson_file):
+    """Load a collection as RANGES byte ranges in parallel worker processes
+
+    Every range commits its own rows, but the migration's checkpoint only
+    completes once all of them are loaded: a resumed run deletes what the
+    ranges wrote and loads them again. Tables the importer numbers get a
+    block of ids per range, in file order, and AUTO_INCREMENT is moved
+    past the last block once every range is in. Their id mappings only go
+    to ID_MAP_TABLE, not this process's memory: no later migration looks
+    them up. Returns what each range's loader returned.
+    """
+    loader, table, lookups = RANGE_LOADERS[name]
+    stage = current_stage()
+    with load_session() as conn:
+        checkpoint = Checkpoint(name, conn, [table])
+        # Documents a sequential run committed before it was interrupted
+        skipped = checkpoint.documents
+        ranges = split_bson_file(bson_file, RANGES, skip=skipped)
+        allocator = IdAllocator(conn, table) if table in id_mappings else None
+        first_id = allocator.next_id if allocator else None
+        lookup_records = {
+            lookup_table: b''.join(MAPPING_RECORD.pack(*record) for record in id_mappings[lookup_table].records())
+            for lookup_table in lookups
+        }
+        print(f"Loading {name} in {len(ranges)} ranges")
+        # End the transaction the reads above opened, so its metadata lock
+        # on the table isn't held while the ranges load
+        conn.commit()
+        
+        futures = []
+        with ProcessPoolExecutor(max_workers=max(len(ranges), 1), mp_context=multiprocessing.get_context('spawn')) as pool:
+            for start, end, documents in ranges:
+                futures.append(pool.submit(load_range, name, bson_file, start, end, first_id, lookup_records,
+                                           LOAD_MODE, USE_PURE))
+                if first_id is not None:
+                    first_id += documents
+            results = [future.result() for future in futures]
+        if allocator:
+            allocator.next_id = first_id
+            allocator.finish()
+        
+        for range_stage, _ in results:
+            if stage:
+                stage.merge(range_stage)
+        if stage:
+            stage.file_size = os.path.getsize(bson_file)
+        checkpoint.documents = skipped + sum(documents for _, _, documents in ranges)
+        checkpoint.complete()
+    return [result for _, result in results]
+
+# Each migration with the migrations whose rows or id mappings it needs
+MIGRATIONS = {
+    'settings': (migrate_settings, []),
+    'users': (migrate_users, []),
+    'categories': (migrate_categories, []),
+    'brands': (migrate_brands, []),
+    'attributes': (migrate_attributes, []),
+    'lead_forms': (migrate_lead_forms, []),
+    'banks': (migrate_banks, ['brands']),
+    'campaigns': (migrate_campaigns, ['lead_forms', 'brands', 'categories']),
+    'posts': (migrate_posts, ['categories']),
+    'pages': (migrate_pages, []),
+    'sliders': (migrate_sliders, []),
+    'ads': (migrate_ads, []),
+    'products': (migrate_products, ['brands']),
+    'product_price_histories': (migrate_product_price_histories, ['products']),
+    'cars': (migrate_cars, []),
+    'real_estates': (migrate_real_estates, []),
+    'leads': (migrate_leads, ['campaigns', 'users', 'lead_forms']),
+}
+
+def run_migrations(migrations, max_workers=MAX_WORKERS):
+    """Run migrations on a thread pool, starting each once its dependencies finish
+
+    Independent collections load concurrently, so the total time approaches
+    the longest dependency chain. A migration whose dependency failed is
+    skipped; failures are raised together at the end.
+    """
+    for name, (_, dependencies) in migrations.items():
+        for dependency in dependencies:
+            if dependency not in migrations:
+                raise ValueError(f"Migration {name} depends on unknown migration {dependency}")
+
+    # Start migrations with the longest chain of dependents first
+    chain_lengths = {}
+
+    def chain_length(name, seen=()):
+        if name not in chain_lengths:
+            if name in seen:
+                raise ValueError(f"Dependency cycle between migrations: {', '.join(seen)}")
+            dependents = [other for other, (_, dependencies) in migrations.items() if name in dependencies]
+            chain_lengths[name] = 1 + max((chain_length(other, seen + (name,)) for other in dependents), default=0)
+        return chain_lengths[name]
+
+    for name in migrations:
+        chain_length(name)
+
+    waiting = {name: set(dependencies) for name, (_, dependencies) in migrations.items()}
+    running = {}
+    started = {}
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while waiting or running:
+            ready = [name for name, dependencies in waiting.items() if not dependencies]
+            for name in sorted(ready, key=chain_length, reverse=True):
+                del waiting[name]
+                started[name] = time.monotonic()
+                running[pool.submit(run_stage, name, migrations[name][0])] = name
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    print(f"Finished {name} in {time.monotonic() - started[name]:.1f}s")
+                    for dependencies in waiting.values():
+                        dependencies.discard(name)
+                except Exception as e:
+                    print(f"Migration {name} failed: {e}")
+                    failed.append(name)
+
+            # Skip everything downstream of a failure, transitively
+            skipped = True
+            while skipped:
+                skipped = False
+                for dependent, dependencies in list(waiting.items()):
+                    blocked_by = [dependency for dependency in dependencies if dependency in failed]
+                    if blocked_by:
+                        print(f"Skipping {dependent}: dependency {blocked_by[0]} failed")
+                        del waiting[dependent]
+                        failed.append(dependent)
+                        skipped = True
+
+    if failed:
+        raise RuntimeError(f"Migrations failed: {', '.join(failed)}")
+
+def checksum_document(columns, doc, reference=None):
+    """Return a document's _id and the CRC32 of each verified column (runs in a worker process)
+
+    A value is hashed as the text MySQL stores; None stands for NULL. The
+    value of the `reference` column is returned as it is.
+    """
+    checksums = []
+    for field, default in columns.values():
+        value = doc.get(field, default)
+        checksums.append(None if value is None else zlib.crc32(str(value).encode()))
+    result = {'_id': doc['_id'], 'checksums': checksums}
+    if reference:
+        field, default = columns[reference]
+        result['reference'] = doc.get(field, default)
+    return result
+
+def table_checksums(table, columns):
+    """Total a table's rows and column checksums per block of VERIFY_RANGE ids"""
+    sums = ''.join(f", COUNT({column}), SUM(CRC32({column}))" for column in columns)
+    blocks = {}
+    with load_session() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT id DIV %s, COUNT(*){sums} FROM {table} GROUP BY 1", (VERIFY_RANGE,))
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for block, *totals in rows:
+                blocks[int(block)] = [int(total or 0) for total in totals]
+        cursor.close()
+    return blocks
+
+def source_checksums(bson_file, columns, mapping, skip=None):
+    """Total a BSON file's documents and column checksums per block of the ids they map to
+
+    Documents are decoded and hashed by the worker processes. A document
+    mapped to a row an earlier one already accounts for (a duplicate
+    brand) isn't counted again. With `skip` as a column and its known
+    values, documents without a row whose value isn't known were skipped
+    by the migration. Returns the totals and file positions of the
+    documents per block, the _ids of documents without a row, the number
+    of skipped documents and the number of documents read.
+    """
+    blocks = {}
+    positions = {}
+    unmapped = []
+    skipped = 0
+    # One bit per MySQL id
+    claimed = bytearray()
+    documents = 0
+    reference, known = skip or (None, None)
+    checksum = partial(checksum_document, columns, reference=reference)
+    for position, doc in enumerate(prepare_in_processes(bson_file, checksum)):
+        documents += 1
+        mysql_id = mapping.get(doc.get('_id')) if '_error' not in doc else None
+        if mysql_id is None:
+            if reference and '_error' not in doc and doc['reference'] not in known:
+                skipped += 1
+            else:
+                unmapped.append(str(doc.get('_id')))
+            continue
+        byte, bit = divmod(mysql_id, 8)
+        if byte >= len(claimed):
+            claimed.extend(bytes(max(byte + 1 - len(claimed), len(claimed))))
+        if claimed[byte] & (1 << bit):
+            continue
+        claimed[byte] |= 1 << bit
+        block = mysql_id // VERIFY_RANGE
+        if block not in blocks:
+            blocks[block] = [0] * (1 + 2 * len(columns))
+            positions[block] = array('Q')
+        totals = blocks[block]
+        totals[0] += 1
+        for column, checksum in enumerate(doc['checksums']):
+            if checksum is not None:
+                totals[1 + 2 * column] += 1
+                totals[2 + 2 * column] += checksum
+        positions[block].append(position)
+    return blocks, positions, unmapped, skipped, documents
+
+def compare_block(table, columns, bson_file, index, mapping, block, positions):
+    """Compare the documents and rows of one block of ids one by one
+
+    Returns the _ids of documents whose row is missing, the _ids of those
+    whose row differs with the differing columns, and the ids of rows
+    none of the documents maps to.
+    """
+    first = block * VERIFY_RANGE
+    checksums = ''.join(f", CRC32({column})" for column in columns)
+    with load_session() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT id{checksums} FROM {table} WHERE id >= %s AND id < %s",
+                       (first, first + VERIFY_RANGE))
+        rows = {int(row[0]): [None if value is None else int(value) for value in row[1:]]
+                for row in cursor.fetchall()}
+        cursor.close()
+
+    missing = []
+    differing = {}
+    for doc in read_bson_documents(bson_file, positions, index):
+        row = rows.pop(mapping.get(doc['_id']), None)
+        if row is None:
+            missing.append(str(doc['_id']))
+            continue
+        expected = checksum_document(columns, doc)['checksums']
+        if row != expected:
+            differing[str(doc['_id'])] = [
+                column for column, stored, wanted in zip(columns, row, expected) if stored != wanted
+            ]
+    return missing, differing, sorted(rows)
+
+def verify_table(table):
+    """Reconcile a table with its BSON file, returning what was found
+
+    The file is read through the worker processes while MySQL totals the
+    table on another connection. Returns None if the file doesn't exist.
+    """
+    columns = VERIFY_COLUMNS[table]
+    filename = SOURCE_FILES[table]
+    bson_file = os.path.join(MONGO_BACKUP_PATH, filename)
+    if not os.path.exists(bson_file):
+        print(f"  {table}: {filename} not found, not verified")
+        return None
+
+    mapping = IdMapping(spill=table in MAPPING_SPILL_TABLES)
+    skip = None
+    with load_session() as conn:
+        cursor = conn.cursor()
+        read_saved_mapping(cursor, table, mapping)
+        if table in VERIFY_SKIPS:
+            column, other = VERIFY_SKIPS[table]
+            cursor.execute(f"SELECT DISTINCT {column} FROM {other}")
+            skip = (column, {row[0] for row in cursor.fetchall()})
+        cursor.close()
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        table_blocks = pool.submit(table_checksums, table, columns)
+        source_blocks, positions, unmapped, skipped, documents = source_checksums(bson_file, columns, mapping, skip)
+        table_blocks = table_blocks.result()
+
+    result = {
+        'documents': documents,
+        'rows': sum(totals[0] for totals in table_blocks.values()),
+        'mismatched_blocks': 0,
+        'skipped': skipped,
+        'not_migrated': unmapped,
+        'missing_rows': [],
+        'differing': {},
+        'unexpected_rows': [],
+    }
+    index = None
+    for block in sorted(source_blocks.keys() | table_blocks.keys()):
+        if source_blocks.get(block) == table_blocks.get(block):
+            continue
+        result['mismatched_blocks'] += 1
+        index = index or load_bson_index(bson_file)
+        missing, differing, unexpected = compare_block(
+            table, columns, bson_file, index, mapping, block, positions.get(block, ())
+        )
+        result['missing_rows'].extend(missing)
+        result['differing'].update(differing)
+        result['unexpected_rows'].extend(unexpected)
+    return result
+
+def verify_migration():
+    """Reconcile every table in VERIFY_COLUMNS with its BSON file
+
+    Up to MAX_WORKERS tables are verified at a time. Prints what doesn't
+    match, writes the findings to VERIFY_REPORT_PATH and returns whether
+    everything matched.
+    """
+    print("Verifying migrated tables...")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {table: pool.submit(verify_table, table) for table in VERIFY_COLUMNS}
+
+    results = {}
+    matched = True
+    for table, future in futures.items():
+        try:
+            result = results[table] = future.result()
+        except Exception as e:
+            print(f"  {table}: error verifying: {e}")
+            results[table] = {'error': str(e)}
+            matched = False
+            continue
+        if result is None:
+            continue
+        problems = [key for key in ('not_migrated', 'missing_rows', 'differing', 'unexpected_rows') if result[key]]
+        summary = f"  {table}: {result['documents']} documents, {result['rows']} rows"
+        if result['skipped']:
+            summary += f", {result['skipped']} skipped by the migration"
+        if not problems:
+            print(f"{summary}, all match")
+            continue
+        matched = False
+        print(f"{summary}, " + ', '.join(f"{len(result[key])} {key.replace('_', ' ')}" for key in problems))
+        for key in problems:
+            for example in itertools.islice(result[key], VERIFY_EXAMPLES):
+                detail = f" ({', '.join(result[key][example])})" if key == 'differing' else ''
+                print(f"    {key.replace('_', ' ')}: {example}{detail}")
+
+    with open(VERIFY_REPORT_PATH, 'w') as f:
+        json.dump({
+            'verified': datetime.now().isoformat(timespec='seconds'),
+            'matched': matched,
+            'tables': results,
+        }, f, indent=2)
+    print(f"Wrote verification report to {VERIFY_REPORT_PATH}")
+    return matched
+
+def migrate_all(resume=False, incremental=False, export=None, rebuild_indexes=False, verify=False, replay=False):
+    """Run all migrations, in parallel where the dependencies allow
+
+    With resume=True nothing is truncated: finished migrations only reload
+    their id mappings and interrupted ones continue from their checkpoint,
+    in the mode the interrupted run used. With incremental=True nothing is
+    truncated either; only documents updated since the previous run are
+    migrated and rows that already exist are updated in place. With
+    export='csv' or 'parquet' the rows are written to EXPORT_PATH, with
+    export='sql' to a dump file replayable with the mysql client, and MySQL
+    isn't used at all. With rebuild_indexes=True secondary indexes of the
+    largest tables are dropped during the load and recreated at the end.
+    With verify=True the tables are reconciled with the BSON files once
+    every migration has succeeded. With replay=True (and incremental=True)
+    every document is migrated regardless of the watermarks.
+    """
+    global _incremental, _replay, _export_format, _sql_dump
     print("Starting MongoDB to MySQL migration...")
     print("=" * 50)
     
-    # Truncate all tables first
-    truncate_all_tables()
-    
-    # Run migrations in order (respecting foreign key dependencies)
-    migrate_settings()
-    migrate_users()
-    migrate_categories()
-    migrate_brands()
-    migrate_attributes()
-    migrate_lead_forms()  # Must be before campaigns
-    migrate_banks()
-    migrate_campaigns()
-    migrate_posts()
-    migrate_pages()
-    migrate_sliders()
-    migrate_ads()
-    migrate_products()
-    migrate_product_price_histories()  # Must be after products
-    migrate_cars()
-    migrate_real_estates()
-    migrate_leads()  # Must be after campaigns and users
+    migrations = MIGRATIONS
+    _export_format = export
+    if export:
+        if export == 'parquet' and pyarrow is None:
+            raise RuntimeError("Exporting to Parquet needs pyarrow (pip install pyarrow)")
+        # Brands and GTINs are looked up in this run's output, not MySQL
+        reset_brand_index()
+        exported_gtins.clear()
+        for mapping in id_mappings.values():
+            mapping.clear()
+        EXPORT_PATH.mkdir(parents=True, exist_ok=True)
+        if export == 'sql':
+            _sql_dump = SqlDump(EXPORT_PATH / DUMP_FILENAME)
+    elif resume:
+        ensure_sync_tables()
+        state = load_checkpoint_state()
+        incremental = state.get('run', {}).get('incremental', False)
+        rebuild_indexes = state.get('run', {}).get('rebuild_indexes', False)
+        migrations = {
+            name: (
+                partial(restore_migration, name)
+                if state.get(name, {}).get('status') == 'done' else migrate,
+                dependencies
+            )
+            for name, (migrate, dependencies) in MIGRATIONS.items()
+        }
+    else:
+        ensure_sync_tables()
+        # Truncate all tables first, unless only changes are migrated
+        if not incremental:
+            truncate_all_tables()
+        # A replay's own dead letters start afresh; its input was moved aside
+        if replay or not incremental:
+            reset_dead_letters()
+        reset_checkpoints()
+        save_checkpoint_entry('run', {'incremental': incremental, 'rebuild_indexes': rebuild_indexes})
+    
+    _incremental = incremental
+    _replay = replay
+    if incremental:
+        load_saved_mappings()
+    if rebuild_indexes and not export:
+        drop_secondary_indexes()
+    elif INDEX_DDL_PATH.exists() and not export:
+        print("Restoring secondary indexes dropped by an interrupted run")
+        rebuild_secondary_indexes()
+    
+    stages.clear()
+    started = datetime.now()
+    try:
+        run_migrations(migrations)
+        if verify:
+            run_stage('verify', verify_migration)
+    finally:
+        if _sql_dump:
+            _sql_dump.close()
+            print(f"Wrote SQL dump to {_sql_dump.path}")
+            _sql_dump = None
+        if rebuild_indexes and not export:
+            run_stage('rebuild_indexes', rebuild_secondary_indexes)
+        write_report(started, f"{export} export" if export else 'incremental' if incremental else 'full', resume)
     
     print("=" * 50)
     print("Migration completed!")
     print(f"Total records migrated:")
-    for table, mapping in id_mappings.items():
-        if mapping:
-            print(f"  {table}: {len(mapping)}")
+    for name, stage in stages.items():
+        for table, rows in stage.rows.items():
+            print(f"  {table}: {rows}")
+    failed = sum(sum(stage.failed.values()) for stage in stages.values())
+    if failed:
+        print(f"{failed} rows were rejected; their documents are in {DEAD_LETTER_PATH} "
+              f"and can be migrated again with --replay")
+
+def replay_dead_letters():
+    """Migrate the documents in DEAD_LETTER_PATH again, updating rows in place
+
+    The files are moved aside first, so documents rejected again end up in
+    fresh dead-letter files. An interrupted replay is picked up again by
+    the next one.
+    """
+    global MONGO_BACKUP_PATH
+    replay_path = DEAD_LETTER_PATH.with_name(DEAD_LETTER_PATH.name + '-replay')
+    if not replay_path.exists():
+        if not DEAD_LETTER_PATH.exists():
+            print("No dead letters to replay")
+            return
+        DEAD_LETTER_PATH.rename(replay_path)
+    MONGO_BACKUP_PATH = str(replay_path)
+    migrate_all(incremental=True, replay=True)
+    shutil.rmtree(replay_path)
+
+def write_report(started, mode, resume):
+    """Write the metrics of every stage of the run to REPORT_PATH"""
+    report = {
+        'started': started.isoformat(timespec='seconds'),
+        'finished': datetime.now().isoformat(timespec='seconds'),
+        'mode': mode,
+        'resumed': resume,
+        'stages': {name: stage.report() for name, stage in stages.items()},
+    }
+    report['totals'] = {
+        key: sum(stage[key] for stage in report['stages'].values())
+        for key in ('documents_read', 'bytes_decoded', 'rows_written', 'rows_skipped', 'rows_failed', 'sql_statements')
+    }
+    report['totals']['elapsed_seconds'] = round((datetime.now() - started).total_seconds(), 3)
+    report['totals']['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    with open(REPORT_PATH, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote migration report to {REPORT_PATH}")
 
 if __name__ == "__main__":
-    migrate_all()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Migrate MongoDB BSON backups to MySQL")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted run from its last checkpoint instead of starting over")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only migrate documents updated since the previous run, updating existing rows")
+    parser.add_argument('--export', choices=('csv', 'parquet', 'sql'),
+                        help="write the transformed rows to CSV or Parquet files, or a gzipped SQL dump, "
+                             "instead of MySQL")
+    parser.add_argument('--export-path', type=Path, default=EXPORT_PATH,
+                        help=f"directory the export is written to (default: {EXPORT_PATH})")
+    parser.add_argument('--rebuild-indexes', action='store_true',
+                        help="drop the secondary indexes and foreign keys of the largest tables for the load "
+                             "and recreate them afterwards")
+    parser.add_argument('--load-mode', choices=('insert', 'infile'), default=LOAD_MODE,
+                        help="write every table with multi-row INSERTs, or load the largest ones with "
+                             f"LOAD DATA LOCAL INFILE (default: {LOAD_MODE})")
+    parser.add_argument('--pure', action='store_true', default=USE_PURE,
+                        help="use the pure Python MySQL protocol implementation instead of the C extension")
+    parser.add_argument('--ranges', type=int, default=RANGES,
+                        help="load price histories and leads in this many parallel byte ranges "
+                             f"(default: {RANGES})")
+    parser.add_argument('--verify', action='store_true',
+                        help="compare the migrated tables with the BSON files after the migration")
+    parser.add_argument('--verify-only', action='store_true',
+                        help="only compare the tables with the BSON files, without migrating")
+    parser.add_argument('--replay', action='store_true',
+                        help=f"migrate the rejected documents in {DEAD_LETTER_PATH} again, updating rows in place")
+    args = parser.parse_args()
+    if args.ranges < 1:
+        parser.error("--ranges must be at least 1")
+    if args.replay and (args.resume or args.incremental or args.export or args.rebuild_indexes
+                        or args.verify or args.verify_only):
+        parser.error("--replay can't be combined with --resume, --incremental, --export, "
+                     "--rebuild-indexes or --verify")
+    if args.export and (args.resume or args.incremental or args.rebuild_indexes
+                        or args.verify or args.verify_only):
+        parser.error("--export always starts over without a database and can't be combined with "
+                     "--resume, --incremental, --rebuild-indexes or --verify")
+    EXPORT_PATH = args.export_path
+    LOAD_MODE = args.load_mode
+    USE_PURE = args.pure
+    RANGES = args.ranges
+    if args.verify_only:
+        sys.exit(0 if verify_migration() else 1)
+    if args.replay:
+        replay_dead_letters()
+    else:
+        migrate_all(resume=args.resume, incremental=args.incremental, export=args.export,
+                    rebuild_indexes=args.rebuild_indexes, verify=args.verify)
\ No newline at end of file
@@ -0,0 +1,38 @@
+"""Run the importer against the benchmark's SQLite stand-in for MySQL"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+BENCHMARK_PATH = Path(__file__).resolve().parent.parent / 'mongo-to-mysql-benchmark.py'
+
+spec = importlib.util.spec_from_file_location('mongo_to_mysql_benchmark', BENCHMARK_PATH)
+benchmark = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = benchmark
+spec.loader.exec_module(benchmark)
+
+@pytest.fixture
+def importer():
+    return benchmark.importer
+
+@pytest.fixture
+def stand_in(tmp_path, monkeypatch, importer):
+    """Point the importer at an empty dump directory and a fresh stand-in database
+
+    Returns the database and a function writing a collection to the dump.
+    """
+    database = benchmark.StandInDatabase()
+    pool = benchmark.CountingPool(database.connect, benchmark.Statistics())
+    monkeypatch.setattr(importer, 'get_connection_pool', lambda: pool)
+    dump_path = tmp_path / 'dump'
+    dump_path.mkdir()
+    monkeypatch.setattr(importer, 'MONGO_BACKUP_PATH', str(dump_path))
+    for name in ('CHECKPOINT_PATH', 'DEAD_LETTER_PATH', 'REPORT_PATH', 'INDEX_DDL_PATH', 'BSON_INDEX_PATH'):
+        monkeypatch.setattr(importer, name, tmp_path / getattr(importer, name).name)
+
+    def write_collection(name, documents):
+        benchmark.write_collection(dump_path / f"{name}.bson", documents)
+
+    return database, write_collection
@@ -0,0 +1,51 @@
+"""Incremental runs, which update the rows of documents migrated before"""
+
+import json
+from datetime import datetime
+
+from bson import ObjectId
+
+def test_new_user_with_a_stored_email_is_rejected(importer, stand_in):
+    database, write_collection = stand_in
+    first = {'_id': ObjectId(), 'firstName': 'A', 'email': 'same@example.com', 'updatedAt': datetime(2024, 1, 1)}
+    write_collection('User', [first])
+    importer.migrate_all()
+
+    second = {'_id': ObjectId(), 'firstName': 'B', 'email': 'same@example.com', 'updatedAt': datetime(2024, 2, 1)}
+    write_collection('User', [first, second])
+    importer.migrate_all(incremental=True)
+
+    assert database.sqlite.execute("SELECT id, first_name FROM users").fetchall() == [(1, 'A')]
+    assert second['_id'] not in importer.id_mappings['users']
+    with open(importer.DEAD_LETTER_PATH / importer.DEAD_LETTER_LOG, encoding='utf-8') as f:
+        dead_letters = [json.loads(line) for line in f]
+    assert [entry['_id'] for entry in dead_letters] == [str(second['_id'])]
+
+def test_changed_user_is_updated_in_place(importer, stand_in):
+    database, write_collection = stand_in
+    user = {'_id': ObjectId(), 'firstName': 'A', 'email': 'a@example.com', 'updatedAt': datetime(2024, 1, 1)}
+    write_collection('User', [user])
+    importer.migrate_all()
+
+    user.update(firstName='Renamed', updatedAt=datetime(2024, 2, 1))
+    added = {'_id': ObjectId(), 'firstName': 'B', 'email': 'b@example.com', 'updatedAt': datetime(2024, 2, 1)}
+    write_collection('User', [added, user])
+    importer.migrate_all(incremental=True)
+
+    assert database.sqlite.execute("SELECT id, first_name FROM users ORDER BY id").fetchall() == [(1, 'Renamed'), (2, 'B')]
+    assert importer.id_mappings['users'].get(added['_id']) == 2
+
+def test_stored_id_mappings_are_overwritten(importer, stand_in):
+    database, write_collection = stand_in
+    user = {'_id': ObjectId(), 'firstName': 'A', 'email': 'a@example.com', 'updatedAt': datetime(2024, 1, 1)}
+    write_collection('User', [user])
+    importer.migrate_all()
+
+    with importer.load_session() as conn:
+        writer = importer.BatchWriter(conn, importer.ID_MAP_TABLE, ('table_name', 'mongo_id', 'mysql_id'),
+                                      name='id mapping', upsert=True)
+        writer.add(('users', user['_id'].binary, 7))
+        writer.close()
+        conn.commit()
+
+    assert database.sqlite.execute(f"SELECT mysql_id FROM {importer.ID_MAP_TABLE}").fetchall() == [(7,)]
@@ -0,0 +1,24 @@
+"""Rows the database rejects end up in the dead-letter files"""
+
+import json
+from datetime import datetime
+
+from bson import ObjectId
+
+def test_row_too_big_for_a_packet_is_dead_lettered(importer, stand_in, monkeypatch):
+    database, write_collection = stand_in
+    monkeypatch.setattr(importer, 'get_max_allowed_packet', lambda conn: importer.PACKET_HEADROOM + 4096)
+    users = [
+        {'_id': ObjectId(), 'firstName': 'A', 'email': 'a@example.com', 'updatedAt': datetime(2024, 1, 1)},
+        {'_id': ObjectId(), 'firstName': 'B' * 8192, 'email': 'b@example.com', 'updatedAt': datetime(2024, 1, 1)},
+        {'_id': ObjectId(), 'firstName': 'C', 'email': 'c@example.com', 'updatedAt': datetime(2024, 1, 1)},
+    ]
+    write_collection('User', users)
+    importer.migrate_all()
+
+    assert database.sqlite.execute("SELECT first_name FROM users ORDER BY id").fetchall() == [('A',), ('C',)]
+    assert users[1]['_id'] not in importer.id_mappings['users']
+    with open(importer.DEAD_LETTER_PATH / importer.DEAD_LETTER_LOG, encoding='utf-8') as f:
+        dead_letters = [json.loads(line) for line in f]
+    assert [entry['_id'] for entry in dead_letters] == [str(users[1]['_id'])]
+    assert (importer.DEAD_LETTER_PATH / 'User.bson').stat().st_size > 8192